@@ -0,0 +1,50 @@
+import threading
+import time
+from collections import OrderedDict
+from copy import deepcopy
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from .cache import get_generation, token_generation
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that remembers recently used tokens in the
+    process, so most authenticated requests skip the token and user query.
+
+    An entry is dropped after AUTH_TOKEN_CACHE_TIMEOUT seconds and the
+    least recently used ones once there are AUTH_TOKEN_CACHE_SIZE of them.
+    It is also checked against a generation counter in the shared cache,
+    bumped when the token is deleted (logout, user deletion) or its user
+    is saved (password or is_active changes), see api.signals. With a
+    per-process cache backend other processes only notice such changes
+    when their entry expires."""
+
+    _lock = threading.Lock()
+    _tokens = OrderedDict()
+
+    def authenticate_credentials(self, key):
+        generation = get_generation(token_generation(key))
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry is not None:
+                self._tokens.move_to_end(key)
+        if entry is not None:
+            token, entry_generation, expires = entry
+            if entry_generation == generation and expires > time.monotonic():
+                return self.copy_credentials(token)
+        user, token = super().authenticate_credentials(key)
+        expires = time.monotonic() + settings.AUTH_TOKEN_CACHE_TIMEOUT
+        with self._lock:
+            self._tokens[key] = (token, generation, expires)
+            self._tokens.move_to_end(key)
+            while len(self._tokens) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self._tokens.popitem(last=False)
+        return self.copy_credentials(token)
+
+    @staticmethod
+    def copy_credentials(token):
+        """Each request gets its own user object, views may change it."""
+        token = deepcopy(token)
+        return token.user, token
@@ -0,0 +1,154 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+RECIPES_GENERATION = 'recipes'
+INGREDIENTS_GENERATION = 'ingredients'
+TAGS_GENERATION = 'tags'
+HITS_KEY = 'recipes:cache:hits'
+MISSES_KEY = 'recipes:cache:misses'
+
+
+def _generation_key(name):
+    return f'generation:{name}'
+
+
+def get_generation(name):
+    """Current value of a generation counter.
+
+    A counter that is missing (never set or evicted) is started from the
+    current time so it can never fall back to a value that was already
+    used in cache keys."""
+    key = _generation_key(name)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def get_generations(names):
+    """Current values of several generation counters with one cache
+    round trip, as {name: generation}."""
+    keys = {_generation_key(name): name for name in names}
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        start = int(time.time() * 1000)
+        for key in missing:
+            cache.add(key, start, timeout=None)
+        found.update(cache.get_many(missing))
+        for key in missing:
+            found.setdefault(key, start)
+    return {keys[key]: generation for key, generation in found.items()}
+
+
+def recipe_generation(recipe_id):
+    """Name of the counter bumped on every change of one recipe."""
+    return f'recipe:{recipe_id}'
+
+
+def author_generation(user_id):
+    """Name of the counter bumped on every change of one user."""
+    return f'user:{user_id}'
+
+
+def token_generation(key):
+    """Name of the counter bumped when an API token or its user
+    changes. The token itself is not used in cache keys."""
+    return f'token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def membership_generation(kind, user_id):
+    """Name of the counter bumped on every change of one cached set of
+    api.memberships."""
+    return f'memberships:{kind}:{user_id}'
+
+
+def increment_generation(name):
+    """Bump a generation counter now and return its new value."""
+    try:
+        return cache.incr(_generation_key(name))
+    except ValueError:
+        return get_generation(name)
+
+
+def bump_generation(name):
+    """Invalidate everything cached under a generation counter once the
+    current transaction commits."""
+    transaction.on_commit(lambda: increment_generation(name))
+
+
+def _increment(key):
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, timeout=None)
+
+
+def get_cache_stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0.0,
+    }
+
+
+def reset_cache_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
+
+
+def response_cache_key(request, action, kwargs):
+    """Cache key built from the normalized query string, so that the
+    order of parameters and repeated values do not matter."""
+    params = sorted(
+        (name, sorted(set(request.query_params.getlist(name))))
+        for name in request.query_params
+    )
+    raw = repr((
+        request.scheme,
+        request.get_host(),
+        action,
+        sorted(kwargs.items()),
+        params,
+    ))
+    digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+    generation = get_generation(RECIPES_GENERATION)
+    return f'recipes:response:{generation}:{digest}'
+
+
+def cache_anonymous_response(view_method):
+    """Serve anonymous requests from the cache.
+
+    Only response data is cached, rendering still follows content
+    negotiation. Authenticated users always get a freshly built response
+    with their own flags."""
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return view_method(self, request, *args, **kwargs)
+        key = response_cache_key(request, view_method.__name__, kwargs)
+        data = cache.get(key)
+        if data is not None:
+            _increment(HITS_KEY)
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        _increment(MISSES_KEY)
+        response = view_method(self, request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RECIPES_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    return wrapper
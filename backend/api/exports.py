@@ -0,0 +1,66 @@
+import csv
+import json
+
+from django.http import StreamingHttpResponse
+
+NAME = 'ingredient__name'
+UNIT = 'ingredient__measurement_unit'
+
+
+class Echo:
+    """File-like object that returns written values instead of
+    buffering them, so csv.writer can feed a generator."""
+
+    def write(self, value):
+        return value
+
+
+def iter_txt(ingredients):
+    yield 'Купить:\n'
+    for ingredient in ingredients:
+        yield (
+            f'{ingredient[NAME]} ({ingredient[UNIT]}) - '
+            f'{ingredient["amount"]}\n'
+        )
+
+
+def iter_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredients:
+        yield writer.writerow(
+            (ingredient[NAME], ingredient[UNIT], ingredient['amount'])
+        )
+
+
+def iter_json(ingredients):
+    separator = '['
+    for ingredient in ingredients:
+        yield separator + json.dumps({
+            'name': ingredient[NAME],
+            'measurement_unit': ingredient[UNIT],
+            'amount': ingredient['amount'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+EXPORT_FORMATS = {
+    'txt': (iter_txt, 'text/plain; charset=utf-8'),
+    'csv': (iter_csv, 'text/csv; charset=utf-8'),
+    'json': (iter_json, 'application/json'),
+}
+
+
+def shopping_list_response(ingredients, export_format, filename):
+    """Stream the shopping list rows as they come from the database
+    cursor without building the whole document in memory."""
+    generator, content_type = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(
+        generator(ingredients.iterator()),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{filename}.{export_format}"'
+    )
+    return response
@@ -0,0 +1,75 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def parse_field_names(request, param):
+    """Comma-separated field names of a query parameter, None when the
+    parameter is absent or empty."""
+    names = [
+        name.strip()
+        for name in request.query_params.get(param, '').split(',')
+        if name.strip()
+    ]
+    return names or None
+
+
+def pick_fields(names, fields=None, omit=None):
+    """The names kept by `fields` and `omit`, in their original order."""
+    unknown = (set(fields or ()) | set(omit or ())) - set(names)
+    if unknown:
+        raise ValidationError({
+            FIELDS_PARAM: f'Unknown fields: {", ".join(sorted(unknown))}'
+        })
+    return tuple(
+        name for name in names
+        if (fields is None or name in fields) and name not in (omit or ())
+    )
+
+
+class SparseFieldsMixin:
+    """Serializer taking `fields` and `omit` arguments that limit the
+    fields it outputs, as in the dynamic fields example of the DRF
+    docs. Method fields that are dropped are never called."""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        omit = kwargs.pop('omit', None)
+        super().__init__(*args, **kwargs)
+        kept = pick_fields(tuple(self.fields), fields, omit)
+        for name in list(self.fields):
+            if name not in kept:
+                self.fields.pop(name)
+
+
+class SparseFieldsViewMixin:
+    """Pass the `fields` and `omit` query parameters of read requests to
+    the serializer, get_queryset() asks wants_field() to skip joins,
+    prefetches and annotations for fields left out."""
+
+    def sparse_fields_kwargs(self):
+        if self.request.method not in SAFE_METHODS:
+            return {}
+        kwargs = {
+            'fields': parse_field_names(self.request, FIELDS_PARAM),
+            'omit': parse_field_names(self.request, OMIT_PARAM),
+        }
+        return {key: value for key, value in kwargs.items() if value}
+
+    def wants_field(self, name):
+        kwargs = self.sparse_fields_kwargs()
+        return (
+            name in kwargs.get('fields', (name,))
+            and name not in kwargs.get('omit', ())
+        )
+
+    def picked_fields(self, names):
+        return pick_fields(names, **self.sparse_fields_kwargs())
+
+    def get_serializer(self, *args, **kwargs):
+        if issubclass(self.get_serializer_class(), SparseFieldsMixin):
+            for key, value in self.sparse_fields_kwargs().items():
+                kwargs.setdefault(key, value)
+        return super().get_serializer(*args, **kwargs)
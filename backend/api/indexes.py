@@ -0,0 +1,59 @@
+import threading
+from bisect import bisect_left, bisect_right
+
+from recipes.models import Ingredient
+from .cache import INGREDIENTS_GENERATION, get_generation
+
+
+def fold(value):
+    """Normalize a name for case-insensitive matching."""
+    return value.casefold().replace('ё', 'е').strip()
+
+
+class IngredientIndex:
+    """Per-process sorted index of ingredient names.
+
+    Rows are kept sorted by their case-folded name, so prefix matches are
+    found with two binary searches. The index is rebuilt lazily when the
+    ingredients generation counter changes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = None
+        self._keys = []
+        self._rows = []
+
+    def _build(self):
+        rows = Ingredient.objects.values('id', 'name', 'measurement_unit')
+        entries = sorted(
+            (fold(row['name']), row['name'], row['id'], row) for row in rows
+        )
+        return ([entry[0] for entry in entries],
+                [entry[3] for entry in entries])
+
+    def _ensure_fresh(self):
+        generation = get_generation(INGREDIENTS_GENERATION)
+        if generation == self._generation:
+            return self._keys, self._rows
+        with self._lock:
+            if generation != self._generation:
+                self._keys, self._rows = self._build()
+                self._generation = generation
+            return self._keys, self._rows
+
+    def search(self, query):
+        """Ingredients whose name starts with the query, followed by
+        those that contain it elsewhere in the name."""
+        keys, rows = self._ensure_fresh()
+        query = fold(query)
+        start = bisect_left(keys, query)
+        end = bisect_right(keys, query + '\U0010ffff', lo=start)
+        prefixed = rows[start:end]
+        contained = [
+            row for key, row in zip(keys, rows)
+            if query in key and not key.startswith(query)
+        ]
+        return prefixed + contained
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,78 @@
+from collections import defaultdict
+
+from django.db.models import F, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from rest_framework.exceptions import ValidationError
+
+from recipes.models import Recipe
+
+RECIPES_LIMIT_PARAM = 'recipes_limit'
+IDS_PARAM = 'ids'
+MAX_BATCH_SIZE = 100
+
+
+def parse_recipes_limit(request):
+    """Validated `recipes_limit` query parameter, None when absent."""
+    limit = request.query_params.get(RECIPES_LIMIT_PARAM)
+    if limit in (None, ''):
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise ValidationError(
+            {RECIPES_LIMIT_PARAM: 'Must be a positive integer'}
+        )
+    return limit
+
+
+def parse_ids(request):
+    """Ids from the comma-separated `ids` query parameter, in the order
+    given and without repeats."""
+    raw = request.query_params.get(IDS_PARAM, '')
+    try:
+        ids = [int(value) for value in raw.split(',') if value.strip()]
+    except ValueError:
+        raise ValidationError(
+            {IDS_PARAM: 'Must be a comma-separated list of integers'}
+        )
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise ValidationError({IDS_PARAM: 'This parameter is required'})
+    if len(ids) > MAX_BATCH_SIZE:
+        raise ValidationError(
+            {IDS_PARAM: f'At most {MAX_BATCH_SIZE} ids are allowed'}
+        )
+    return ids
+
+
+def load_recent_recipes(author_ids, limit=None):
+    """Newest recipes of every given author in one query.
+
+    Returns {author_id: [row, ...]} with values() rows for
+    short_recipe_payloads(). With a limit, the recipes are ranked with
+    ROW_NUMBER() OVER (PARTITION BY author_id) so that each author gets
+    at most `limit` of them."""
+    recipes_by_author = defaultdict(list)
+    if not author_ids:
+        return recipes_by_author
+    queryset = Recipe.objects.filter(author_id__in=author_ids)
+    if limit is not None:
+        ranked = queryset.annotate(recipe_rank=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=[F('pub_date').desc(), F('id').desc()],
+        )).order_by().values('id', 'recipe_rank')
+        sql, params = ranked.query.sql_with_params()
+        queryset = Recipe.objects.filter(id__in=RawSQL(
+            f'SELECT id FROM ({sql}) ranked WHERE recipe_rank <= %s',
+            (*params, limit)
+        ))
+    recipes = queryset.order_by('author_id', '-pub_date', '-id').values(
+        'id', 'name', 'image', 'image_variants', 'cooking_time', 'author_id'
+    )
+    for recipe in recipes:
+        recipes_by_author[recipe['author_id']].append(recipe)
+    return recipes_by_author
@@ -0,0 +1,102 @@
+import base64
+import os
+import timeit
+from io import BytesIO
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from api.parsers import FastJSONParser
+from api.payloads import RECIPE_FIELDS, recipe_keys
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import RecipeReadSerializer
+from api.views import RecipeViewSet
+
+
+class Command(BaseCommand):
+    help = ('comparing the API JSON renderer and parser with the DRF '
+            'ones on the recipe list output of RecipeReadSerializer and '
+            'of api.payloads, and on a recipe with a base64 image')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100,
+                            help='number of recipes to render')
+        parser.add_argument('--image-size', type=int, default=2048,
+                            help='size of the image in the parsed '
+                                 'recipe, KB')
+        parser.add_argument('--repeat', type=int, default=50,
+                            help='runs of each benchmark')
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING(
+                'orjson не установлен, сравниваются одинаковые реализации'
+            ))
+        outputs = self.recipe_data(options['recipes'])
+        if not outputs['RecipeReadSerializer']:
+            raise CommandError('Нет рецептов для замера')
+        repeat = options['repeat']
+        for source, data in outputs.items():
+            stock_body = JSONRenderer().render(data)
+            if FastJSONRenderer().render(data) != stock_body:
+                raise CommandError(f'Ответы рендереров различаются: {source}')
+            self.compare(
+                f'Рендеринг {len(data)} рецептов, {source} '
+                f'({len(stock_body)} байт)',
+                lambda: JSONRenderer().render(data),
+                lambda: FastJSONRenderer().render(data),
+                repeat,
+            )
+        data = outputs['api.payloads']
+        image = base64.b64encode(
+            os.urandom(options['image_size'] * 1024)
+        ).decode()
+        body = JSONRenderer().render(
+            dict(data[0], image=f'data:image/png;base64,{image}')
+        )
+        self.compare(
+            f'Разбор рецепта с картинкой ({len(body)} байт)',
+            lambda: JSONParser().parse(BytesIO(body)),
+            lambda: FastJSONParser().parse(BytesIO(body)),
+            repeat,
+        )
+
+    def recipe_data(self, limit):
+        """Recipe list for an anonymous user as RecipeReadSerializer
+        gives it and as RecipeViewSet builds it, by source."""
+        view = RecipeViewSet(action_map={'get': 'list'}, args=(),
+                             kwargs={}, format_kwarg=None)
+        view.request = view.initialize_request(
+            APIRequestFactory().get('/api/recipes/',
+                                    SERVER_NAME=self.server_name())
+        )
+        queryset = view.get_queryset().order_by('-pub_date', '-id')[:limit]
+        return {
+            'RecipeReadSerializer': RecipeReadSerializer(
+                queryset, many=True, context=view.get_serializer_context()
+            ).data,
+            'api.payloads': view.payloads(recipe_keys(queryset),
+                                          RECIPE_FIELDS),
+        }
+
+    def server_name(self):
+        """A host that passes ALLOWED_HOSTS, so that the image URLs can
+        be built."""
+        for host in settings.ALLOWED_HOSTS:
+            host = host.lstrip('.')
+            if host and host != '*':
+                return host
+        return 'localhost'
+
+    def compare(self, title, stock, fast, repeat):
+        stock_time = min(timeit.repeat(stock, number=1, repeat=repeat))
+        fast_time = min(timeit.repeat(fast, number=1, repeat=repeat))
+        self.stdout.write(
+            f'{title}:\n'
+            f'  DRF: {stock_time * 1000:.2f} мс\n'
+            f'  API: {fast_time * 1000:.2f} мс '
+            f'(в {stock_time / fast_time:.1f} раза быстрее)'
+        )
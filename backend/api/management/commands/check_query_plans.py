@@ -0,0 +1,195 @@
+import re
+from itertools import cycle
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from rest_framework.test import APIRequestFactory
+
+from api import memberships
+from api.payloads import recipe_keys
+from api.views import RecipeViewSet
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag)
+from users.models import Subscribe
+
+User = get_user_model()
+
+PREFIX = 'plan-check'
+PAGE_SIZE = 6
+# Tables that grow with the number of users and recipes. Tags and
+# ingredients are small reference tables that may be scanned.
+LARGE_TABLES = {
+    model._meta.db_table for model in (
+        User, Recipe, Recipe.tags.through, IngredientInRecipe, Favorite,
+        ShoppingCart, ShoppingListItem, Subscribe,
+    )
+}
+SEQ_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    # "SCAN t" without USING is a full table scan, virtual (FTS5) tables
+    # are searched through their own index.
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?(\w+)\b(?! USING| VIRTUAL)'),
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('seeding a large dataset in a rolled back transaction and '
+            'failing if EXPLAIN of a hot API query shows a sequential '
+            'scan of a large table')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=20000,
+                            help='number of recipes to seed')
+
+    def handle(self, *args, **options):
+        pattern = SEQ_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(f'{connection.vendor} не поддерживается')
+        failures = []
+        try:
+            with transaction.atomic():
+                fixtures = self.seed(options['recipes'])
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+                for name, queryset in self.hot_queries(**fixtures):
+                    plan = queryset.explain()
+                    scanned = sorted(
+                        set(pattern.findall(plan)) & LARGE_TABLES
+                    )
+                    if scanned:
+                        failures.append(name)
+                        self.stdout.write(self.style.ERROR(
+                            f'{name}: полный просмотр {", ".join(scanned)}'
+                        ))
+                    else:
+                        self.stdout.write(f'{name}: OK')
+                    if options['verbosity'] > 1 or scanned:
+                        self.stdout.write(plan)
+                raise Rollback
+        except Rollback:
+            pass
+        if failures:
+            raise CommandError(f'Запросов без индекса: {len(failures)}')
+        self.stdout.write(self.style.SUCCESS('Все запросы используют индексы'))
+
+    def seed(self, recipes):
+        users = max(recipes // 10, 10)
+        self.stdout.write(f'Пользователей: {users}, рецептов: {recipes}')
+        user_ids = self.bulk(User, [
+            User(username=f'{PREFIX}-{i}', email=f'{PREFIX}-{i}@example.com',
+                 first_name='plan', last_name='check')
+            for i in range(users)
+        ])
+        tag_ids = self.bulk(Tag, [
+            Tag(name=f'{PREFIX}-{i}', color=f'#pc{i:04d}',
+                slug=f'{PREFIX}-{i}')
+            for i in range(10)
+        ])
+        ingredient_ids = self.bulk(Ingredient, [
+            Ingredient(name=f'{PREFIX}-{i}', measurement_unit='г')
+            for i in range(1000)
+        ])
+        authors = cycle(user_ids)
+        recipe_ids = self.bulk(Recipe, [
+            Recipe(author_id=next(authors), name=f'{PREFIX} {i}',
+                   text=f'{PREFIX} рецепт {i}', cooking_time=10,
+                   image='recipes/plan-check.jpg')
+            for i in range(recipes)
+        ])
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe_id,
+                                tag_id=tag_ids[i % len(tag_ids)])
+            for i, recipe_id in enumerate(recipe_ids)
+        ], batch_size=1000)
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_ids[(i * 3 + j) % 1000],
+                amount=1,
+            )
+            for i, recipe_id in enumerate(recipe_ids) for j in range(3)
+        ], batch_size=1000)
+        for model in (Favorite, ShoppingCart):
+            model.objects.bulk_create([
+                model(user_id=user_id,
+                      recipe_id=recipe_ids[(i * 7 + j) % recipes])
+                for i, user_id in enumerate(user_ids) for j in range(5)
+            ], batch_size=1000)
+        Subscribe.objects.bulk_create([
+            Subscribe(user_id=user_id,
+                      author_id=user_ids[(i + j) % users])
+            for i, user_id in enumerate(user_ids) for j in range(1, 6)
+        ], batch_size=1000)
+        ShoppingListItem.objects.bulk_create([
+            ShoppingListItem(user_id=user_id,
+                             ingredient_id=ingredient_ids[(i + j) % 1000],
+                             amount=1)
+            for i, user_id in enumerate(user_ids) for j in range(10)
+        ], batch_size=1000)
+        return {
+            'user': User.objects.get(id=user_ids[0]),
+            'author_id': user_ids[1],
+            'recipe_id': recipe_ids[len(recipe_ids) // 2],
+            'tag': Tag.objects.get(id=tag_ids[0]),
+        }
+
+    def bulk(self, model, objects):
+        model.objects.bulk_create(objects, batch_size=1000)
+        names = {
+            User: 'username', Tag: 'slug', Ingredient: 'name', Recipe: 'name'
+        }
+        field = names[model]
+        return list(model.objects.filter(
+            **{f'{field}__startswith': PREFIX}
+        ).order_by('id').values_list('id', flat=True))
+
+    def recipe_list(self, user=None, **params):
+        view = RecipeViewSet(action_map={'get': 'list'}, args=(),
+                             kwargs={}, format_kwarg=None)
+        view.request = view.initialize_request(
+            APIRequestFactory().get('/api/recipes/', params)
+        )
+        if user is not None:
+            view.request.user = user
+        return recipe_keys(view.filter_queryset(view.get_queryset()))
+
+    def hot_queries(self, user, author_id, recipe_id, tag):
+        """The queries behind the busiest endpoints, as API views build
+        them."""
+        recipe_ids = list(
+            self.recipe_list()[:PAGE_SIZE].values_list('id', flat=True)
+        )
+        return (
+            ('Список рецептов', self.recipe_list()[:PAGE_SIZE]),
+            ('Рецепты по тегу',
+             self.recipe_list(user, tags=tag.slug)[:PAGE_SIZE]),
+            ('Рецепты автора',
+             self.recipe_list(user, author=author_id)[:PAGE_SIZE]),
+            ('Избранное',
+             self.recipe_list(user, is_favorited=1)[:PAGE_SIZE]),
+            ('Рецепты в корзине',
+             self.recipe_list(user, is_in_shopping_cart=1)[:PAGE_SIZE]),
+            ('Поиск рецептов',
+             self.recipe_list(user, search='рецепт 4242')[:PAGE_SIZE]),
+            ('Рецепт', self.recipe_list(user).filter(id=recipe_id)),
+            ('Ингредиенты рецептов',
+             IngredientInRecipe.objects.select_related('ingredient').filter(
+                 recipe_id__in=recipe_ids)),
+            ('Избранное пользователя',
+             memberships.ids_query(memberships.FAVORITES, user.id)),
+            ('Корзина пользователя',
+             memberships.ids_query(memberships.CART, user.id)),
+            ('Подписки пользователя',
+             memberships.ids_query(memberships.SUBSCRIPTIONS, user.id)),
+            ('Подписки',
+             User.objects.filter(subscribing__user=user)[:PAGE_SIZE]),
+            ('Проверка подписки', Subscribe.objects.filter(
+                user=user, author_id=author_id)),
+            ('Список покупок', ShoppingListItem.objects.filter(
+                user=user, amount__gt=0).order_by('ingredient__name')),
+        )
@@ -0,0 +1,31 @@
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from api.cache import get_cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = ('show hit rate of the anonymous recipe response cache; the '
+            'counters are only visible here with a shared CACHE_BACKEND')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        if isinstance(caches['default'], LocMemCache):
+            # Every process has its own local memory cache, so the
+            # counters of the web server cannot be read from here.
+            raise CommandError(
+                'Кэш в памяти процесса: счётчики веб-сервера недоступны, '
+                'укажите общий CACHE_BACKEND'
+            )
+        stats = get_cache_stats()
+        self.stdout.write(
+            f"hits: {stats['hits']}\n"
+            f"misses: {stats['misses']}\n"
+            f"hit rate: {stats['hit_rate']:.1%}"
+        )
+        if options['reset']:
+            reset_cache_stats()
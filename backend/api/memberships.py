@@ -0,0 +1,161 @@
+"""Cached sets of the recipes a user has favorited or put in the cart
+and of the authors they follow.
+
+Each set is kept in the cache as a sorted array of ids, so a flag is a
+binary search and a page of flags needs two cache reads in all. The
+favorite and cart actions, which write with raw SQL, update a cached
+set once their transaction commits. Subscriptions and other changes
+made through the ORM (the admin, cascades) do the same from signals.
+A set that is missing is loaded from the database with one query.
+
+Every set has a generation counter that is part of its cache key and
+is bumped by every change. A set loaded before a change committed is
+stored under the old generation and never read again, so a slow read
+cannot put back a set that misses the change."""
+from array import array
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscribe
+from .cache import (get_generation, get_generations, increment_generation,
+                    membership_generation)
+
+FAVORITES = 'favorites'
+CART = 'cart'
+SUBSCRIPTIONS = 'subscriptions'
+SOURCES = {
+    FAVORITES: (Favorite, 'recipe_id'),
+    CART: (ShoppingCart, 'recipe_id'),
+    SUBSCRIPTIONS: (Subscribe, 'author_id'),
+}
+# Longer sets are not inlined into filter queries as id IN (...).
+MAX_FILTER_IDS = 500
+
+
+def _key(kind, user_id, generation):
+    return f'memberships:{kind}:{user_id}:{generation}'
+
+
+def ids_query(kind, user_id):
+    model, column = SOURCES[kind]
+    return model.objects.filter(user_id=user_id).order_by(
+        column
+    ).values_list(column, flat=True)
+
+
+def get_many_ids(kinds, user_id):
+    """Sorted arrays of the ids in several sets of a user, as
+    {kind: ids}."""
+    generations = get_generations(
+        membership_generation(kind, user_id) for kind in kinds
+    )
+    keys = {
+        kind: _key(kind, user_id,
+                   generations[membership_generation(kind, user_id)])
+        for kind in kinds
+    }
+    cached = cache.get_many(keys.values())
+    sets = {}
+    for kind, key in keys.items():
+        if key in cached:
+            sets[kind] = cached[key]
+            continue
+        ids = array('q', ids_query(kind, user_id))
+        # Ids read inside a transaction are cached only once it commits.
+        transaction.on_commit(lambda key=key, ids=ids: cache.add(
+            key, ids, settings.MEMBERSHIP_CACHE_TIMEOUT
+        ))
+        sets[kind] = ids
+    return sets
+
+
+def get_ids(kind, user_id):
+    """Sorted array of the ids in one set of a user."""
+    return get_many_ids([kind], user_id)[kind]
+
+
+def contains(ids, value):
+    index = bisect_left(ids, value)
+    return index < len(ids) and ids[index] == value
+
+
+def context_ids(context, kind, user):
+    """get_ids() for the user of a request, read once per serializer
+    context."""
+    memo = context.setdefault('memberships', {})
+    if kind not in memo:
+        memo[kind] = get_ids(kind, user.id)
+    return memo[kind]
+
+
+def _change(kind, user_id, value, present):
+
+    def write():
+        name = membership_generation(kind, user_id)
+        generation = get_generation(name)
+        ids = cache.get(_key(kind, user_id, generation))
+        new_generation = increment_generation(name)
+        # Another change in between may be missing from the set read,
+        # the next read loads the set from the database then.
+        if ids is None or new_generation != generation + 1:
+            return
+        if contains(ids, value) != present:
+            if present:
+                insort(ids, value)
+            else:
+                del ids[bisect_left(ids, value)]
+        cache.set(_key(kind, user_id, new_generation), ids,
+                  settings.MEMBERSHIP_CACHE_TIMEOUT)
+
+    transaction.on_commit(write)
+
+
+def membership_of(instance):
+    """(kind, user_id, id) of a Favorite, ShoppingCart or Subscribe."""
+    for kind, (model, column) in SOURCES.items():
+        if isinstance(instance, model):
+            return kind, instance.user_id, getattr(instance, column)
+    raise TypeError(f'{type(instance).__name__} is not a membership')
+
+
+def add(kind, user_id, value):
+    """Add an id to a cached set once the transaction commits."""
+    _change(kind, user_id, value, True)
+
+
+def remove(kind, user_id, value):
+    """Remove an id from a cached set once the transaction commits."""
+    _change(kind, user_id, value, False)
+
+
+def set_flags(rows, user, fields):
+    """Set the per-user flags of recipe rows from the cached sets."""
+    if user.is_anonymous:
+        return rows
+    flags = (
+        ('is_favorited', 'is_favorited', FAVORITES, 'id'),
+        ('is_in_shopping_cart', 'is_in_shopping_cart', CART, 'id'),
+        ('author', 'author_is_subscribed', SUBSCRIPTIONS, 'author_id'),
+    )
+    flags = [flag for flag in flags if flag[0] in fields]
+    sets = get_many_ids([flag[2] for flag in flags], user.id)
+    for field, name, kind, column in flags:
+        ids = sets[kind]
+        for row in rows:
+            row[name] = (
+                row[column] is not None and contains(ids, row[column])
+            )
+    return rows
+
+
+def filter_by_ids(queryset, kind, user, **lookup):
+    """Recipes in one set of the user: id IN (...) from the cached set
+    when it is short, otherwise the given join lookup."""
+    ids = get_ids(kind, user.id)
+    if len(ids) > MAX_FILTER_IDS:
+        return queryset.filter(**lookup)
+    return queryset.filter(id__in=list(ids))
@@ -0,0 +1,284 @@
+"""Read-only recipe payloads built straight from values() rows.
+
+The output is the same as RecipeReadSerializer and ShortRecipeSerializer
+give, but no model or serializer instances are created: recipes are read
+with values(), tags and ingredients of a whole page with one values()
+query each, and the getters of the requested fields are looked up once
+per page instead of walking a field tree for every row. The serializers
+take their field lists from here, so both stay in the same order.
+
+The recipe endpoints go further and cache the part of each recipe that
+is the same for every user, see cached_recipe_payloads()."""
+import hashlib
+from collections import defaultdict
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+
+from recipes.images import DEFAULT_FORMAT, image_name
+from recipes.models import IngredientInRecipe, Recipe
+from .cache import (INGREDIENTS_GENERATION, TAGS_GENERATION,
+                    author_generation, get_generations, recipe_generation)
+
+USER_FIELDS = ('id', 'email', 'username', 'first_name', 'last_name',
+               'is_subscribed')
+TAG_FIELDS = ('id', 'name', 'color', 'slug')
+RECIPE_FIELDS = ('id', 'author', 'tags', 'ingredients',
+                 'is_favorited', 'is_in_shopping_cart',
+                 'name', 'text', 'image', 'cooking_time')
+SHORT_RECIPE_FIELDS = ('id', 'name', 'image', 'cooking_time')
+
+FLAG_FIELDS = ('is_favorited', 'is_in_shopping_cart')
+# The part of a recipe that is the same for every user.
+SHARED_FIELDS = tuple(
+    name for name in RECIPE_FIELDS if name not in FLAG_FIELDS
+)
+# Relations cached apart from the recipe columns, with the generation
+# that changes with any of their rows.
+RELATION_GENERATIONS = {
+    'tags': TAGS_GENERATION,
+    'ingredients': INGREDIENTS_GENERATION,
+}
+COLUMN_FIELDS = tuple(
+    name for name in SHARED_FIELDS if name not in RELATION_GENERATIONS
+)
+AUTHOR_COLUMNS = tuple(
+    f'author__{name}' for name in USER_FIELDS
+    if name not in ('id', 'is_subscribed')
+)
+
+
+def recipe_rows(queryset, fields=RECIPE_FIELDS):
+    """values() of the recipe columns the fields need, the author's
+    columns joined. The per-user flags are set on the rows by
+    api.memberships.set_flags(), rows without them get False."""
+    columns = ['id', 'pub_date']
+    columns += [
+        name for name in ('name', 'text', 'cooking_time') if name in fields
+    ]
+    if 'image' in fields:
+        columns += ['image', 'image_variants']
+    if 'author' in fields:
+        columns += ['author_id', *AUTHOR_COLUMNS]
+    return queryset.prefetch_related(None).values(*columns)
+
+
+def recipe_keys(queryset):
+    """values() rows with what cached_recipe_payloads() cannot take from
+    the fragment cache: the ids and the author."""
+    return queryset.prefetch_related(None).values(
+        'id', 'pub_date', 'author_id'
+    )
+
+
+def load_tags(recipe_ids):
+    tags = defaultdict(list)
+    rows = Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('tag_id').values_list(
+        'recipe_id', *(f'tag__{name}' for name in TAG_FIELDS)
+    )
+    for recipe_id, *values in rows:
+        tags[recipe_id].append(dict(zip(TAG_FIELDS, values)))
+    return tags
+
+
+def load_ingredients(recipe_ids):
+    ingredients = defaultdict(list)
+    rows = IngredientInRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('ingredient_id').values_list(
+        'recipe_id', 'ingredient_id', 'ingredient__name',
+        'ingredient__measurement_unit', 'amount'
+    )
+    for recipe_id, pk, name, measurement_unit, amount in rows:
+        ingredients[recipe_id].append({
+            'id': pk,
+            'name': name,
+            'measurement_unit': measurement_unit,
+            'amount': amount,
+        })
+    return ingredients
+
+
+def image_getter(context, default_variant):
+    """Image URL of a row, as Base64ImageField builds it."""
+    storage = Recipe._meta.get_field('image').storage
+    variant = context.get('image_variant', default_variant)
+    image_format = context.get('image_format', DEFAULT_FORMAT)
+    request = context.get('request')
+
+    def get_image(row):
+        if not row['image']:
+            return None
+        url = storage.url(image_name(
+            row['image'], row['image_variants'], variant, image_format
+        ))
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    return get_image
+
+
+def get_author(row):
+    if row['author_id'] is None:
+        return None
+    author = {'id': row['author_id']}
+    for name, column in zip(USER_FIELDS[1:], AUTHOR_COLUMNS):
+        author[name] = row[column]
+    author['is_subscribed'] = row.get('author_is_subscribed', False)
+    return author
+
+
+def recipe_payloads(rows, context, fields=RECIPE_FIELDS,
+                    default_variant='detail'):
+    """Recipe dictionaries with the given fields for rows made by
+    recipe_rows()."""
+    rows = list(rows)
+    recipe_ids = [row['id'] for row in rows]
+    getters = {
+        'id': itemgetter('id'),
+        'author': get_author,
+        'name': itemgetter('name'),
+        'text': itemgetter('text'),
+        'cooking_time': itemgetter('cooking_time'),
+    }
+    if 'tags' in fields:
+        tags = load_tags(recipe_ids) if recipe_ids else {}
+        getters['tags'] = lambda row: tags.get(row['id'], [])
+    if 'ingredients' in fields:
+        ingredients = load_ingredients(recipe_ids) if recipe_ids else {}
+        getters['ingredients'] = lambda row: ingredients.get(row['id'], [])
+    if 'image' in fields:
+        getters['image'] = image_getter(context, default_variant)
+    for name in FLAG_FIELDS:
+        getters[name] = lambda row, name=name: row.get(name, False)
+    selected = [(name, getters[name]) for name in fields]
+    return [
+        {name: get(row) for name, get in selected}
+        for row in rows
+    ]
+
+
+def fragment_keys(rows, context, relations):
+    """Cache keys of the shared parts of recipes, as
+    {(part, recipe_id): key}.
+
+    The 'recipe' part holds the columns and the author and its key
+    changes with the recipe, its author, and with the image variant and
+    site the URLs are built for. Each of the given relations is a part
+    of its own, whose key changes with the recipe and any tag or
+    ingredient."""
+    request = context.get('request')
+    digest = hashlib.md5(repr((
+        context.get('image_variant', 'detail'),
+        context.get('image_format', DEFAULT_FORMAT),
+        request.build_absolute_uri('/') if request is not None else '',
+    )).encode('utf-8')).hexdigest()
+    author_ids = {row['author_id'] for row in rows} - {None}
+    generations = get_generations([
+        *(RELATION_GENERATIONS[name] for name in relations),
+        *(recipe_generation(row['id']) for row in rows),
+        *(author_generation(author_id) for author_id in author_ids),
+    ])
+    keys = {}
+    for row in rows:
+        prefix = (
+            f'recipes:fragment:{row["id"]}:'
+            f'{generations[recipe_generation(row["id"])]}'
+        )
+        keys['recipe', row['id']] = (
+            f'{prefix}:'
+            f'{generations.get(author_generation(row["author_id"]))}:'
+            f'{digest}'
+        )
+        for name in relations:
+            keys[name, row['id']] = (
+                f'{prefix}:{name}:'
+                f'{generations[RELATION_GENERATIONS[name]]}'
+            )
+    return keys
+
+
+def load_fragments(rows, context, fields):
+    """Shared parts of the recipes that the fields need, as
+    {recipe_id: fragment}. Missing parts are built with one query each
+    and cached; a tag or ingredient list is only built when requested."""
+    relations = [name for name in RELATION_GENERATIONS if name in fields]
+    keys = fragment_keys(rows, context, relations)
+    cached = cache.get_many(keys.values())
+    parts = {part: cached[key] for part, key in keys.items() if key in cached}
+    missing = defaultdict(list)
+    for name, recipe_id in keys:
+        if (name, recipe_id) not in parts:
+            missing[name].append(recipe_id)
+    built = {}
+    if missing['recipe']:
+        for fragment in recipe_payloads(
+            recipe_rows(Recipe.objects.filter(id__in=missing['recipe']),
+                        COLUMN_FIELDS),
+            context,
+            COLUMN_FIELDS,
+        ):
+            if fragment['author'] is not None:
+                del fragment['author']['is_subscribed']
+            built['recipe', fragment['id']] = fragment
+    loaders = {'tags': load_tags, 'ingredients': load_ingredients}
+    for name in relations:
+        if missing[name]:
+            loaded = loaders[name](missing[name])
+            for recipe_id in missing[name]:
+                built[name, recipe_id] = loaded.get(recipe_id, [])
+    if built:
+        cache.set_many(
+            {keys[part]: value for part, value in built.items()},
+            settings.RECIPE_FRAGMENT_TIMEOUT,
+        )
+        parts.update(built)
+    fragments = {}
+    for row in rows:
+        fragment = parts.get(('recipe', row['id']))
+        if fragment is not None:
+            fragments[row['id']] = dict(fragment, **{
+                name: parts[name, row['id']] for name in relations
+            })
+    return fragments
+
+
+def cached_recipe_payloads(rows, context, fields=RECIPE_FIELDS):
+    """Same output as recipe_payloads() for rows made by recipe_keys().
+
+    The parts shared by all users come from the fragment cache and the
+    flags of the current user from the rows. Recipes deleted since the
+    rows were read are left out."""
+    rows = list(rows)
+    if not set(fields) & (set(SHARED_FIELDS) - {'id'}):
+        return recipe_payloads(rows, context, fields)
+    fragments = load_fragments(rows, context, fields)
+    payloads = []
+    for row in rows:
+        fragment = fragments.get(row['id'])
+        if fragment is None:
+            continue
+        payload = {}
+        for name in fields:
+            if name in FLAG_FIELDS:
+                payload[name] = row.get(name, False)
+            elif name == 'author' and fragment['author'] is not None:
+                payload[name] = dict(
+                    fragment['author'],
+                    is_subscribed=row.get('author_is_subscribed', False),
+                )
+            else:
+                payload[name] = fragment[name]
+        payloads.append(payload)
+    return payloads
+
+
+def short_recipe_payloads(rows, context=None):
+    """Recipes as ShortRecipeSerializer gives them, with card-sized
+    images."""
+    return recipe_payloads(rows, context or {}, SHORT_RECIPE_FIELDS,
+                           default_variant='card')
@@ -1,9 +1,10 @@
 import base64
+import binascii
 
 import rest_framework.status
+from django.conf import settings
 from django.core.files.base import ContentFile
 from django.contrib.auth import get_user_model
-from django.db.models import F
 from django.db.transaction import atomic
 from djoser.serializers import UserSerializer, UserCreateSerializer
 from rest_framework import serializers
@@ -14,12 +15,20 @@ from recipes.models import (
     IngredientInRecipe,
     Ingredient,
     Tag,
-    Favorite,
-    ShoppingCart)
+    ShoppingListItem)
+from recipes.images import (DEFAULT_FORMAT, ImageTooLarge, check_dimensions,
+                            image_url, schedule_image_processing,
+                            strip_metadata)
 from users.models import Subscribe
+from . import memberships
+from .fieldsets import SparseFieldsMixin
+from .loaders import load_recent_recipes, parse_recipes_limit
+from .payloads import (RECIPE_FIELDS, SHORT_RECIPE_FIELDS, TAG_FIELDS,
+                       USER_FIELDS, short_recipe_payloads)
 
 MIN_INGREDIENT_AMOUNT = 1
 MAX_INGREDIENT_AMOUNT = 32000
+ALREADY_FOLLOWED = 'You have already followed this user'
 MIN_COOKING_TIME = 1
 MAX_COOKING_TIME = 3200
 
@@ -27,14 +36,56 @@ User = get_user_model()
 
 
 class Base64ImageField(serializers.ImageField):
-    """Field for codding image to base64"""
+    """Field for codding image to base64.
+
+    Uploads are checked against the byte and pixel limits and stored
+    without their EXIF metadata. The image is represented by the URL of
+    the resized variant that fits the context, or of the original until
+    the variants are generated."""
+
+    def __init__(self, *args, variant='detail', **kwargs):
+        self.variant = variant
+        super().__init__(*args, **kwargs)
 
     def to_internal_value(self, data):
+        max_bytes = settings.RECIPE_IMAGE_MAX_BYTES
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-        return super().to_internal_value(data)
+            try:
+                format, imgstr = data.split(';base64,')
+                if len(imgstr) * 3 // 4 > max_bytes:
+                    raise ValidationError(
+                        f'Image is larger than {max_bytes} bytes'
+                    )
+                ext = format.split('/')[-1]
+                data = ContentFile(base64.b64decode(imgstr),
+                                   name='temp.' + ext)
+            except (ValueError, binascii.Error):
+                raise ValidationError('Invalid base64 image')
+        if getattr(data, 'size', 0) > max_bytes:
+            raise ValidationError(f'Image is larger than {max_bytes} bytes')
+        image = super().to_internal_value(data)
+        try:
+            check_dimensions(image.image)
+            image.seek(0)
+            return strip_metadata(image, image.name)
+        except ImageTooLarge as error:
+            raise ValidationError(str(error))
+        except (OSError, ValueError):
+            raise ValidationError('Invalid image')
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        url = image_url(
+            value,
+            getattr(value.instance, 'image_variants', None),
+            self.context.get('image_variant', self.variant),
+            self.context.get('image_format', DEFAULT_FORMAT),
+        )
+        request = self.context.get('request', None)
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -44,21 +95,22 @@ class CustomUserCreateSerializer(UserCreateSerializer):
                   'last_name', 'password']
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(SparseFieldsMixin, UserSerializer):
     """Serializer for User model"""
 
     is_subscribed = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = User
-        fields = ('id', 'email', 'username', 'first_name',
-                  'last_name', 'is_subscribed')
+        fields = USER_FIELDS
 
     def get_is_subscribed(self, obj):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
-        return Subscribe.objects.filter(user=user, author=obj).exists()
+        return memberships.contains(memberships.context_ids(
+            self.context, memberships.SUBSCRIPTIONS, user
+        ), obj.id)
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -74,7 +126,7 @@ class TagSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Tag
-        fields = ['id', 'name', 'color', 'slug']
+        fields = TAG_FIELDS
 
 
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
@@ -88,14 +140,14 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
 
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
-    image = Base64ImageField()
+    image = Base64ImageField(variant='card')
 
     class Meta:
         model = Recipe
-        fields = ['id', 'name', 'image', 'cooking_time']
+        fields = SHORT_RECIPE_FIELDS
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     tags = TagSerializer(read_only=True, many=True)
     author = CustomUserSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField()
@@ -109,40 +161,61 @@ class RecipeReadSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        fields = ('id', 'author', 'tags', 'ingredients',
-                  'is_favorited', 'is_in_shopping_cart',
-                  'name', 'text', 'image', 'cooking_time')
+        fields = RECIPE_FIELDS
 
     def get_ingredients(self, obj):
-        recipe = obj
-        ingredients = recipe.ingredients.values(
-            'id',
-            'name',
-            'measurement_unit',
-            amount=F('ingredientinrecipe__amount')
-        )
-        return ingredients
-
-    def get_is_favorited(self, obj):
+        amounts = obj.ingredienttorecipe.all()
+        if 'ingredienttorecipe' not in getattr(
+                obj, '_prefetched_objects_cache', {}):
+            amounts = amounts.select_related(
+                'ingredient'
+            ).order_by('ingredient_id')
+        return [
+            {
+                'id': amount.ingredient.id,
+                'name': amount.ingredient.name,
+                'measurement_unit': amount.ingredient.measurement_unit,
+                'amount': amount.amount,
+            } for amount in amounts
+        ]
+
+    def get_flag(self, obj, kind):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
-        return Favorite.objects.filter(user=user, recipe=obj).exists()
+        return memberships.contains(
+            memberships.context_ids(self.context, kind, user), obj.id
+        )
+
+    def get_is_favorited(self, obj):
+        return self.get_flag(obj, memberships.FAVORITES)
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return ShoppingCart.objects.filter(user=user, recipe=obj).exists()
+        return self.get_flag(obj, memberships.CART)
+
+
+def check_references(model, ids, label):
+    """Validate a list of primary keys with a single id__in query."""
+    duplicates = sorted({pk for pk in ids if ids.count(pk) > 1})
+    if duplicates:
+        raise ValidationError(
+            f'{label} ids are repeated: {", ".join(map(str, duplicates))}'
+        )
+    found = set(
+        model.objects.filter(id__in=ids).values_list('id', flat=True)
+    )
+    missing = [pk for pk in ids if pk not in found]
+    if missing:
+        raise ValidationError(
+            f'{label} ids do not exist: {", ".join(map(str, missing))}'
+        )
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """Serializer for Recipe model"""
 
     author = CustomUserSerializer(read_only=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all())
+    tags = serializers.ListField(child=serializers.IntegerField())
     ingredients = IngredientInRecipeSerializer(many=True,)
     image = Base64ImageField(required=False, allow_null=True)
     cooking_time = serializers.IntegerField(
@@ -156,12 +229,22 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                   'image', 'cooking_time', 'tags',
                   'ingredients']
 
+    def validate_tags(self, tags):
+        check_references(Tag, tags, 'Tag')
+        return tags
+
+    def validate_ingredients(self, ingredients):
+        check_references(
+            Ingredient,
+            [ingredient['id'] for ingredient in ingredients],
+            'Ingredient'
+        )
+        return ingredients
+
     def validate(self, data):
         tags = data.get('tags')
         if not tags:
             raise serializers.ValidationError({'tags': 'Need to choose tag'})
-        if len(tags) != len(set(tags)):
-            raise serializers.ValidationError()
         ingredients = data.get('ingredients')
         if not ingredients:
             raise serializers.ValidationError(
@@ -172,7 +255,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
     def create_ingredients(self, recipe, ingredients):
         IngredientInRecipe.objects.bulk_create(
             [IngredientInRecipe(
-                ingredient=Ingredient.objects.get(id=ingredient['id']),
+                ingredient_id=ingredient['id'],
                 recipe=recipe,
                 amount=ingredient['amount']
             ) for ingredient in ingredients]
@@ -185,15 +268,61 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
         self.create_ingredients(recipe=recipe, ingredients=ingredients)
+        if recipe.image:
+            schedule_image_processing(recipe.id)
         return recipe
 
+    def update_ingredients(self, recipe, ingredients):
+        """Bring the stored ingredient amounts in line with the request
+        using only the inserts, updates and deletes that are needed.
+
+        Returns the amounts before and after the change."""
+        new_amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        current = {}
+        removed = []
+        for item in IngredientInRecipe.objects.filter(recipe=recipe):
+            if (item.ingredient_id in current
+                    or item.ingredient_id not in new_amounts):
+                removed.append(item)
+            else:
+                current[item.ingredient_id] = item
+        old_amounts = {}
+        for item in removed + list(current.values()):
+            old_amounts[item.ingredient_id] = (
+                old_amounts.get(item.ingredient_id, 0) + item.amount
+            )
+        changed = []
+        for pk, item in current.items():
+            if item.amount != new_amounts[pk]:
+                item.amount = new_amounts[pk]
+                changed.append(item)
+        if removed:
+            IngredientInRecipe.objects.filter(
+                id__in=[item.id for item in removed]
+            ).delete()
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ['amount'])
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(recipe=recipe, ingredient_id=pk, amount=amount)
+            for pk, amount in new_amounts.items() if pk not in current
+        ])
+        return old_amounts, new_amounts
+
     @atomic
     def update(self, instance, validated_data):
-        instance.tags.clear()
-        IngredientInRecipe.objects.filter(recipe=instance).delete()
         instance.tags.set(validated_data.pop('tags'))
-        ingredients = validated_data.pop('ingredients')
-        self.create_ingredients(instance, ingredients)
+        old_amounts, new_amounts = self.update_ingredients(
+            instance, validated_data.pop('ingredients')
+        )
+        ShoppingListItem.objects.change_recipe(
+            instance.id, old_amounts, new_amounts
+        )
+        if validated_data.get('image'):
+            validated_data['image_variants'] = {}
+            schedule_image_processing(instance.id)
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
@@ -202,7 +331,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         return RecipeReadSerializer(instance, context=context).data
 
 
-class SubscribeSerializer(serializers.ModelSerializer):
+class SubscribeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for adding or deleting subscription.
     And for showing the following list"""
 
@@ -221,7 +350,7 @@ class SubscribeSerializer(serializers.ModelSerializer):
         user = self.context.get('request').user
         if Subscribe.objects.filter(author=author, user=user).exists():
             raise ValidationError(
-                detail='You have already followed this user',
+                detail=ALREADY_FOLLOWED,
                 code=rest_framework.status.HTTP_400_BAD_REQUEST
             )
         if user == author:
@@ -232,18 +361,19 @@ class SubscribeSerializer(serializers.ModelSerializer):
         return data
 
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
     def get_is_subscribed(self, obj):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
-        return Subscribe.objects.filter(user=user, author=obj).exists()
+        return memberships.contains(memberships.context_ids(
+            self.context, memberships.SUBSCRIPTIONS, user
+        ), obj.id)
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        queryset = obj.recipes.all()
-        if limit:
-            queryset = queryset[:int(limit)]
-        return ShortRecipeSerializer(queryset, many=True).data
+        recipes_by_author = self.context.get('recipes_by_author')
+        if recipes_by_author is None:
+            limit = parse_recipes_limit(self.context.get('request'))
+            recipes_by_author = load_recent_recipes([obj.id], limit)
+        return short_recipe_payloads(recipes_by_author.get(obj.id, []))
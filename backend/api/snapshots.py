@@ -0,0 +1,96 @@
+import gzip
+import hashlib
+import threading
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+from .cache import get_generation
+from .renderers import FastJSONRenderer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def parse_accept_encoding(header):
+    """Content codings accepted by the client, mapped to their q-values."""
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+class Snapshot:
+    """Prebuilt JSON body of a whole reference table.
+
+    The body is rendered once per generation of the underlying data and
+    kept together with its gzip and brotli variants and a strong ETag for
+    each of them."""
+
+    def __init__(self, generation, queryset, serializer_class):
+        self.generation = generation
+        self.queryset = queryset
+        self.serializer_class = serializer_class
+        self._lock = threading.Lock()
+        self._built_for = None
+        self._variants = {}
+
+    def _build(self):
+        data = self.serializer_class(self.queryset.all(), many=True).data
+        body = FastJSONRenderer().render(data)
+        digest = hashlib.sha256(body).hexdigest()
+        variants = {
+            'identity': (body, f'"{digest}"'),
+            'gzip': (gzip.compress(body, 9), f'"{digest}-gzip"'),
+        }
+        if brotli is not None:
+            variants['br'] = (brotli.compress(body), f'"{digest}-br"')
+        return variants
+
+    def get_variants(self):
+        generation = get_generation(self.generation)
+        if generation == self._built_for:
+            return self._variants
+        with self._lock:
+            if generation != self._built_for:
+                self._variants = self._build()
+                self._built_for = generation
+            return self._variants
+
+    def response(self, request):
+        variants = self.get_variants()
+        accepted = parse_accept_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        )
+        coding = 'identity'
+        for candidate in ('br', 'gzip'):
+            if candidate in variants and accepted.get(candidate, 0) > 0:
+                coding = candidate
+                break
+        body, etag = variants[coding]
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+        known = {tag for _, tag in variants.values()}
+        requested = {tag.strip() for tag in if_none_match.split(',')}
+        if '*' in requested or known & requested:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type='application/json')
+            if coding != 'identity':
+                response['Content-Encoding'] = coding
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
@@ -0,0 +1,375 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import (APIClient, APIRequestFactory, APITestCase,
+                                 APITransactionTestCase)
+
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Subscribe
+from .authentication import CachedTokenAuthentication
+from .cache import RECIPES_GENERATION, bump_generation
+from .fieldsets import pick_fields
+from .payloads import (RECIPE_FIELDS, SHORT_RECIPE_FIELDS, recipe_keys,
+                       recipe_rows, short_recipe_payloads)
+from .serializers import (RecipeReadSerializer, ShortRecipeSerializer,
+                          SubscribeSerializer)
+from .views import RecipeViewSet
+
+User = get_user_model()
+
+RECIPES = 60
+
+
+class RecipeQueriesTests(APITransactionTestCase):
+    """The recipe list and detail run a fixed number of queries, however
+    many recipes a page holds.
+
+    Transaction test cases are used so that on_commit callbacks, which
+    fill the membership and generation caches, run as in production."""
+
+    def setUp(self):
+        cache.clear()
+        CachedTokenAuthentication._tokens.clear()
+        authors = [
+            User.objects.create_user(
+                email=f'author{i}@example.com', username=f'author{i}',
+                first_name='Автор', last_name=str(i), password='Pass-1234',
+            )
+            for i in range(3)
+        ]
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user', first_name='Имя',
+            last_name='Фамилия', password='Pass-1234',
+        )
+        tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                               slug=f'tag{i}')
+            for i in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'Продукт {i}',
+                                      measurement_unit='г')
+            for i in range(5)
+        ]
+        recipes = [
+            Recipe.objects.create(
+                author=authors[i % len(authors)], name=f'Рецепт {i}',
+                text='Описание', cooking_time=10,
+                image=f'recipes/{i}.jpg',
+            )
+            for i in range(RECIPES)
+        ]
+        for i, recipe in enumerate(recipes):
+            recipe.tags.set(tags[:i % 3 + 1])
+            IngredientInRecipe.objects.bulk_create([
+                IngredientInRecipe(recipe=recipe, ingredient=ingredient,
+                                   amount=10)
+                for ingredient in ingredients[:3]
+            ])
+        Favorite.objects.create(user=self.user, recipe=recipes[-1])
+        ShoppingCart.objects.create(user=self.user, recipe=recipes[-2])
+        Subscribe.objects.create(user=self.user, author=authors[0])
+        self.recipe = recipes[-1]
+        self.anonymous = APIClient()
+        self.authorized = APIClient()
+        self.authorized.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user)}'
+        )
+
+    def assert_queries(self, client, url, cold, warm):
+        """Queries of the first request with empty caches and of a
+        repeated one."""
+        with self.assertNumQueries(cold):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(warm):
+            client.get(url)
+        return response
+
+    def test_list_anonymous(self):
+        for limit in (2, 50):
+            with self.subTest(limit=limit):
+                cache.clear()
+                response = self.assert_queries(
+                    self.anonymous, f'/api/recipes/?limit={limit}', 5, 0
+                )
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_list_authorized(self):
+        for limit in (2, 50):
+            with self.subTest(limit=limit):
+                cache.clear()
+                CachedTokenAuthentication._tokens.clear()
+                response = self.assert_queries(
+                    self.authorized, f'/api/recipes/?limit={limit}', 9, 2
+                )
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_detail_anonymous(self):
+        self.assert_queries(
+            self.anonymous, f'/api/recipes/{self.recipe.id}/', 4, 0
+        )
+
+    def test_detail_authorized(self):
+        response = self.assert_queries(
+            self.authorized, f'/api/recipes/{self.recipe.id}/', 8, 1
+        )
+        self.assertTrue(response.data['is_favorited'])
+
+    def test_list_picked_fields(self):
+        """Tags and ingredients are not loaded for fields that leave
+        them out."""
+        response = self.assert_queries(
+            self.anonymous, '/api/recipes/?limit=50&fields=id,name', 3, 0
+        )
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name'})
+
+    def test_anonymous_response_cache_expired(self):
+        """Without the response cache, the recipes still come from the
+        fragment cache."""
+        for url, count in (('/api/recipes/?limit=2', 2),
+                           ('/api/recipes/?limit=50', 2),
+                           (f'/api/recipes/{self.recipe.id}/', 1)):
+            with self.subTest(url=url):
+                self.anonymous.get(url)
+                bump_generation(RECIPES_GENERATION)
+                with self.assertNumQueries(count):
+                    self.anonymous.get(url)
+
+
+class RecipePayloadsTests(APITestCase):
+    """api.payloads gives the same output as the serializers it
+    replaces on the read endpoints."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user', first_name='Имя',
+            last_name='Фамилия', password='Pass-1234',
+        )
+        authors = [
+            User.objects.create_user(
+                email=f'author{i}@example.com', username=f'author{i}',
+                first_name='Автор', last_name=str(i), password='Pass-1234',
+            )
+            for i in range(2)
+        ]
+        # Tags and ingredients are created in reverse name order, so an
+        # order by name and an order by id differ.
+        tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                               slug=f'tag{i}')
+            for i in reversed(range(3))
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'Продукт {i}',
+                                      measurement_unit='г')
+            for i in reversed(range(3))
+        ]
+        variants = {
+            variant: {
+                'jpeg': f'recipes/aa/bb/{variant}.jpg',
+                'webp': f'recipes/aa/bb/{variant}.webp',
+            }
+            for variant in ('card', 'detail', 'retina')
+        }
+        recipes = [
+            Recipe.objects.create(
+                author=authors[0], name='С размерами', text='Описание',
+                cooking_time=10, image='recipes/aa/bb/original.png',
+                image_variants=variants,
+            ),
+            Recipe.objects.create(
+                author=authors[1], name='Без размеров', text='Описание',
+                cooking_time=20, image='recipes/cc/dd/original.jpg',
+            ),
+            Recipe.objects.create(
+                author=None, name='Без автора', text='Описание',
+                cooking_time=30, image='recipes/ee/ff/original.jpg',
+            ),
+            Recipe.objects.create(
+                author=authors[0], name='Без фотографии', text='Описание',
+                cooking_time=40,
+            ),
+        ]
+        recipes[0].tags.set(tags)
+        recipes[1].tags.set(tags[1:])
+        recipes[2].tags.set(tags[:1])
+        for recipe in recipes[:3]:
+            IngredientInRecipe.objects.bulk_create([
+                IngredientInRecipe(recipe=recipe, ingredient=ingredient,
+                                   amount=amount)
+                for amount, ingredient in enumerate(ingredients, start=1)
+            ])
+        Favorite.objects.create(user=self.user, recipe=recipes[0])
+        Favorite.objects.create(user=self.user, recipe=recipes[2])
+        ShoppingCart.objects.create(user=self.user, recipe=recipes[1])
+        Subscribe.objects.create(user=self.user, author=authors[0])
+        self.queryset = Recipe.objects.order_by('id')
+
+    def views(self, params=None):
+        """Recipe views of anonymous and authorized requests, each with
+        the image sizes and formats of the API."""
+        for user in (AnonymousUser(), self.user):
+            for image in ({}, {'image_size': 'card'},
+                          {'image_size': 'retina', 'image_format': 'webp'}):
+                request = Request(APIRequestFactory().get(
+                    '/api/recipes/', dict(params or {}, **image)
+                ))
+                request.user = user
+                yield RecipeViewSet(request=request, action='retrieve',
+                                    args=(), kwargs={}, format_kwarg=None)
+
+    def assert_same(self, payloads, data):
+        render = JSONRenderer().render
+        self.assertEqual(render(payloads), render(data))
+
+    def view_payloads(self, view, names):
+        """Payloads of the recipes as the view builds them."""
+        rows = recipe_keys(view.get_queryset().order_by('id'))
+        return view.payloads(rows, names)
+
+    def test_recipe_payloads(self):
+        for fields, omit in ((None, None),
+                             (('id', 'author', 'is_favorited'), None),
+                             (None, ('text', 'ingredients', 'author')),
+                             (('image', 'is_in_shopping_cart'), ('image',))):
+            params = {}
+            if fields:
+                params['fields'] = ','.join(fields)
+            if omit:
+                params['omit'] = ','.join(omit)
+            names = pick_fields(RECIPE_FIELDS, fields, omit)
+            for view in self.views(params):
+                context = view.get_serializer_context()
+                with self.subTest(params=params,
+                                  user=str(view.request.user),
+                                  image=context.get('image_variant')):
+                    # The serializer looks the flags up per recipe.
+                    data = RecipeReadSerializer(
+                        self.queryset, many=True, context=context,
+                        fields=fields, omit=omit,
+                    ).data
+                    # Fragments are built first, then read from the cache.
+                    cache.clear()
+                    for _ in range(2):
+                        self.assert_same(self.view_payloads(view, names),
+                                         data)
+
+    def test_short_recipe_payloads(self):
+        contexts = [{}] + [
+            view.get_serializer_context() for view in self.views()
+        ]
+        for context in contexts:
+            with self.subTest(image=context.get('image_variant'),
+                              request='request' in context):
+                data = ShortRecipeSerializer(
+                    self.queryset, many=True, context=context
+                ).data
+                rows = recipe_rows(self.queryset, SHORT_RECIPE_FIELDS)
+                self.assert_same(short_recipe_payloads(rows, context), data)
+
+
+class ImportJsonTests(APITestCase):
+    """Rows loaded by import_json are served at once, although its bulk
+    writes send no signals."""
+
+    def setUp(self):
+        cache.clear()
+        self.tag = Tag.objects.create(name='Завтрак', color='#E26C2D',
+                                      slug='breakfast')
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Рецептов', password='Pass-1234',
+        )
+        recipe = Recipe.objects.create(
+            author=author, name='Каша', text='Описание', cooking_time=10,
+            image='recipes/kasha.jpg',
+        )
+        recipe.tags.set([self.tag])
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def import_file(self, name, content, *args):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        call_command('import_json', path, *args, stdout=StringIO())
+
+    def ingredient_names(self, **params):
+        response = self.client.get('/api/ingredients/', params)
+        return [ingredient['name'] for ingredient in response.json()]
+
+    def test_ingredients(self):
+        self.assertEqual(self.ingredient_names(name='с'), ['соль'])
+        self.assertEqual(self.ingredient_names(), ['соль'])
+        self.import_file('ingredients.csv', 'сахар,г\n')
+        self.assertEqual(self.ingredient_names(name='с'), ['сахар', 'соль'])
+        self.assertCountEqual(self.ingredient_names(), ['сахар', 'соль'])
+
+    def test_tags(self):
+        self.assertEqual(self.client.get('/api/tags/').json()[0]['name'],
+                         'Завтрак')
+        recipes = self.client.get('/api/recipes/').json()['results']
+        self.assertEqual(recipes[0]['tags'][0]['name'], 'Завтрак')
+        self.import_file('tags.json', json.dumps([{
+            'name': 'Утро', 'color': '#E26C2D', 'slug': 'breakfast',
+        }]), '--model', 'tags', '--update')
+        self.assertEqual(self.client.get('/api/tags/').json()[0]['name'],
+                         'Утро')
+        recipes = self.client.get('/api/recipes/').json()['results']
+        self.assertEqual(recipes[0]['tags'][0]['name'], 'Утро')
+
+    def test_dry_run(self):
+        self.assertEqual(self.ingredient_names(name='с'), ['соль'])
+        self.import_file('ingredients.csv', 'сахар,г\n', '--dry-run')
+        self.assertEqual(self.ingredient_names(name='с'), ['соль'])
+
+
+class SubscribeTests(APITestCase):
+
+    def setUp(self):
+        self.user, self.author = [
+            User.objects.create_user(
+                email=f'{name}@example.com', username=name,
+                first_name='Имя', last_name='Фамилия', password='Pass-1234',
+            )
+            for name in ('user', 'author')
+        ]
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/users/{self.author.id}/subscribe/'
+
+    def test_subscribe(self):
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {
+            'non_field_errors': ['You have already followed this user'],
+        })
+
+    def test_concurrent_subscribe(self):
+        """A request that passed the validation while another one was
+        subscribing gets the same answer as a repeated one."""
+        Subscribe.objects.create(user=self.user, author=self.author)
+        with mock.patch.object(SubscribeSerializer, 'validate',
+                               lambda serializer, data: data):
+            response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {
+            'non_field_errors': ['You have already followed this user'],
+        })
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 0)
@@ -1,26 +1,42 @@
+from django.http import Http404
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
+from django.db import IntegrityError
+from django.db.transaction import atomic
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import (IsAuthenticated,
                                         SAFE_METHODS,
                                         )
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from djoser.views import UserViewSet
 
-from recipes.models import (Recipe, IngredientInRecipe, Ingredient,
-                            Tag, Favorite, ShoppingCart)
+from recipes.models import (Recipe, Ingredient, Tag, Favorite,
+                            ShoppingCart, ShoppingListItem,
+                            recipe_amounts, update_counter)
+from recipes.images import FORMATS, VARIANTS
 from users.models import Subscribe
-from .pagination import CustomPagination
+from . import memberships
+from .cache import (INGREDIENTS_GENERATION, TAGS_GENERATION,
+                    cache_anonymous_response)
+from .exports import EXPORT_FORMATS, shopping_list_response
+from .fieldsets import SparseFieldsViewMixin
+from .pagination import CustomPagination, RecipeCursorPagination
 from .permissions import IsAdminOrReadOnly, IsAuthorOrReadOnly
-from .filters import IngredientFilter, RecipeFilter
+from .filters import RecipeFilter
+from .indexes import ingredient_index
+from .loaders import load_recent_recipes, parse_ids, parse_recipes_limit
+from .payloads import (RECIPE_FIELDS, SHORT_RECIPE_FIELDS,
+                       cached_recipe_payloads, recipe_keys, recipe_rows,
+                       short_recipe_payloads)
+from .snapshots import Snapshot
 from .serializers import (TagSerializer, IngredientSerializer,
                           RecipeReadSerializer, RecipeCreateSerializer,
-                          SubscribeSerializer, ShortRecipeSerializer,
-                          CustomUserSerializer)
+                          SubscribeSerializer, CustomUserSerializer,
+                          ALREADY_FOLLOWED)
 
 User = get_user_model()
 
@@ -31,6 +47,12 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (IsAdminOrReadOnly,)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    snapshot = Snapshot(TAGS_GENERATION, queryset, serializer_class)
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format == 'json':
+            return self.snapshot.response(request)
+        return super().list(request, *args, **kwargs)
 
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
@@ -39,11 +61,18 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (IsAdminOrReadOnly,)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientFilter
+    snapshot = Snapshot(INGREDIENTS_GENERATION, queryset, serializer_class)
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        if request.accepted_renderer.format == 'json':
+            return self.snapshot.response(request)
+        return super().list(request, *args, **kwargs)
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     """ViewSet for Recipes"""
 
     permission_classes = (IsAuthorOrReadOnly,)
@@ -52,31 +81,146 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    @property
+    def paginator(self):
+        """Page-number pagination unless the client opts in to keyset
+        pagination with the `cursor` query parameter."""
+        if not hasattr(self, '_paginator'):
+            cursor_param = RecipeCursorPagination.cursor_query_param
+            if cursor_param in self.request.query_params:
+                self._paginator = RecipeCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def get_queryset(self):
+        """Reads build their payloads from values() rows, see
+        api.payloads. Only an update, which answers with
+        RecipeReadSerializer, loads the instance with its author."""
+        queryset = super().get_queryset()
+        if self.action in ('update', 'partial_update'):
+            queryset = queryset.select_related('author')
+        return queryset
+
+    def payloads(self, rows, fields):
+        rows = memberships.set_flags(list(rows), self.request.user, fields)
+        return cached_recipe_payloads(
+            rows, self.get_serializer_context(), fields
+        )
+
+    @cache_anonymous_response
+    def list(self, request, *args, **kwargs):
+        """Recipes are built by api.payloads from values() rows and
+        cached fragments, with the same output as RecipeReadSerializer."""
+        fields = self.picked_fields(RECIPE_FIELDS)
+        rows = recipe_keys(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(self.payloads(rows, fields))
+        return self.get_paginated_response(self.payloads(page, fields))
+
+    @cache_anonymous_response
+    def retrieve(self, request, *args, **kwargs):
+        fields = self.picked_fields(RECIPE_FIELDS)
+        row = get_object_or_404(
+            recipe_keys(self.filter_queryset(self.get_queryset())),
+            id=self.recipe_id(kwargs['pk'])
+        )
+        payloads = self.payloads([row], fields)
+        if not payloads:
+            raise Http404
+        return Response(payloads[0])
+
+    @action(detail=False)
+    @cache_anonymous_response
+    def batch(self, request):
+        """Recipes by `?ids=1,2,3` in the requested order, ids that do
+        not exist are listed in `missing`."""
+        ids = parse_ids(request)
+        fields = self.picked_fields(RECIPE_FIELDS)
+        recipes = {
+            row['id']: row for row in recipe_keys(
+                self.get_queryset().filter(id__in=ids)
+            )
+        }
+        return Response({
+            'results': self.payloads(
+                [recipes[pk] for pk in ids if pk in recipes], fields
+            ),
+            'missing': [pk for pk in ids if pk not in recipes],
+        })
+
+    @atomic
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        update_counter(User.objects.filter(id=self.request.user.id),
+                       'recipes_count', 1)
+
+    @atomic
+    def perform_destroy(self, instance):
+        ShoppingListItem.objects.change_recipe(
+            instance.id, recipe_amounts(instance.id), {}
+        )
+        if instance.author_id is not None:
+            update_counter(User.objects.filter(id=instance.author_id),
+                           'recipes_count', -1)
+        instance.delete()
+
+    def get_serializer_context(self):
+        """Pick the photo variant: cards on the list, full size on the
+        detail page, unless the client asks for a size or format."""
+        context = super().get_serializer_context()
+        image_size = self.request.query_params.get('image_size')
+        if image_size in VARIANTS:
+            context['image_variant'] = image_size
+        elif self.action in ('list', 'batch'):
+            context['image_variant'] = 'card'
+        image_format = self.request.query_params.get('image_format')
+        if image_format in FORMATS:
+            context['image_format'] = image_format
+        return context
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeReadSerializer
         return RecipeCreateSerializer
 
-    def add_to(self, model, user, pk):
-        if model.objects.filter(user=user, recipe__id=pk).exists():
+    @staticmethod
+    def recipe_id(pk):
+        try:
+            return int(pk)
+        except ValueError:
+            raise Http404
+
+    @atomic
+    def add_to(self, model, kind, user, pk, counter, on_change=None):
+        recipe_id = self.recipe_id(pk)
+        if not model.objects.add(user.id, recipe_id):
+            get_object_or_404(Recipe.objects.only('id'), id=recipe_id)
             return Response({
                 'error': 'Recipe is already added to the list'
             }, status=status.HTTP_400_BAD_REQUEST)
-        recipe = get_object_or_404(Recipe, id=pk)
-        model.objects.create(user=user, recipe=recipe)
-        serializer = ShortRecipeSerializer(recipe)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-    def delete_from(self, model, user, pk):
-        obj = model.objects.filter(user=user, recipe__id=pk)
-        if obj.exists():
-            obj.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response({'erroor': 'Рецепт уже удален'},
-                        status=status.HTTP_400_BAD_REQUEST)
+        update_counter(Recipe.objects.filter(id=recipe_id), counter, 1)
+        memberships.add(kind, user.id, recipe_id)
+        if on_change is not None:
+            on_change(user, recipe_id)
+        recipe = short_recipe_payloads(recipe_rows(
+            Recipe.objects.filter(id=recipe_id), SHORT_RECIPE_FIELDS
+        ))[0]
+        return Response(recipe, status=status.HTTP_201_CREATED)
+
+    @atomic
+    def delete_from(self, model, kind, user, pk, counter,
+                    on_change=None):
+        recipe_id = self.recipe_id(pk)
+        if not model.objects.remove(user.id, recipe_id):
+            return Response({'erroor': 'Рецепт уже удален'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        update_counter(Recipe.objects.filter(id=recipe_id), counter, -1)
+        memberships.remove(kind, user.id, recipe_id)
+        if on_change is not None:
+            on_change(user, recipe_id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
         detail=True,
@@ -84,9 +228,11 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=(IsAuthenticated,))
     def favorite(self, request, pk):
         if request.method == 'POST':
-            return self.add_to(Favorite, request.user, pk)
+            return self.add_to(Favorite, memberships.FAVORITES,
+                               request.user, pk, 'favorites_count')
         else:
-            return self.delete_from(Favorite, request.user, pk)
+            return self.delete_from(Favorite, memberships.FAVORITES,
+                                    request.user, pk, 'favorites_count')
 
     @action(
         detail=True,
@@ -94,35 +240,39 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=(IsAuthenticated,))
     def shopping_cart(self, request, pk):
         if request.method == 'POST':
-            return self.add_to(ShoppingCart, request.user, pk)
+            return self.add_to(
+                ShoppingCart, memberships.CART, request.user, pk,
+                'in_carts_count',
+                on_change=ShoppingListItem.objects.add_recipe
+            )
         else:
-            return self.delete_from(ShoppingCart, request.user, pk)
+            return self.delete_from(
+                ShoppingCart, memberships.CART, request.user, pk,
+                'in_carts_count',
+                on_change=ShoppingListItem.objects.remove_recipe
+            )
 
     @action(detail=False, permission_classes=(IsAuthenticated,))
     def download_shopping_cart(self, request):
-        shopping_list = 'Купить:'
-        ingredients = IngredientInRecipe.objects.filter(
-            recipe__shopping_cart__user=request.user
+        export_format = request.query_params.get('type', 'txt')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'type': f'Choose one of: {", ".join(EXPORT_FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        ingredients = ShoppingListItem.objects.filter(
+            user=request.user, amount__gt=0
         ).order_by('ingredient__name').values(
             'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-
-        for ingredient in ingredients:
-            shopping_list += (
-                f"\n{ingredient['ingredient__name']}"
-                f"({ingredient['ingredient__measurement_unit']}) - "
-                f"\n{ingredient['amount']}"
-            )
-            file = 'shopping_list.txt'
-            response = HttpResponse(shopping_list, content_type='text/plain')
-            response['Content-Disposition'] = (
-                f"attachment; filename='{file}.txt'"
-            )
-        return response
+            'ingredient__measurement_unit',
+            'amount'
+        )
+        return shopping_list_response(
+            ingredients, export_format, 'shopping_list'
+        )
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(SparseFieldsViewMixin, UserViewSet):
     """ViewSet for Users"""
 
     pagination_class = CustomPagination
@@ -143,7 +293,16 @@ class CustomUserViewSet(UserViewSet):
                 data=request.data,
                 context={'request': request})
             serializer.is_valid(raise_exception=True)
-            Subscribe.objects.create(user=user, author=author)
+            try:
+                with atomic():
+                    Subscribe.objects.create(user=user, author=author)
+                    update_counter(User.objects.filter(id=author.id),
+                                   'subscribers_count', 1)
+            except IntegrityError:
+                # A concurrent request subscribed after the validation.
+                raise ValidationError({
+                    api_settings.NON_FIELD_ERRORS_KEY: [ALREADY_FOLLOWED]
+                })
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
@@ -151,17 +310,27 @@ class CustomUserViewSet(UserViewSet):
                 Subscribe,
                 user=user,
                 author=author)
-            subscription.delete()
+            with atomic():
+                subscription.delete()
+                update_counter(User.objects.filter(id=author.id),
+                               'subscribers_count', -1)
             return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False, permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
         user = request.user
+        limit = parse_recipes_limit(request)
         queryset = User.objects.filter(subscribing__user=user)
         pages = self.paginate_queryset(queryset)
+        context = {'request': request}
+        if self.wants_field('recipes'):
+            context['recipes_by_author'] = load_recent_recipes(
+                [author.id for author in pages], limit
+            )
         serializer = SubscribeSerializer(
             pages,
             many=True,
-            context={'request': request}
+            context=context,
+            **self.sparse_fields_kwargs()
         )
         return self.get_paginated_response(serializer.data)
@@ -28,6 +28,7 @@ INSTALLED_APPS = [
     'corsheaders',
     'django_filters',
     'api.apps.ApiConfig',
+    'jobs.apps.JobsConfig',
     'users.apps.UsersConfig',
     'recipes.apps.RecipesConfig',
 ]
@@ -84,6 +85,30 @@ DATABASES = {
 }
 DATABASES['default'] = DATABASES['dev' if DEBUG else 'production']
 
+# Cache
+# A shared backend is needed for the generation counters to invalidate
+# every process: docker-compose points the backend and the worker at its
+# memcached service. The local memory default only suits a single
+# process, e.g. runserver or tests.
+
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+)
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+if 'memcached' not in CACHE_BACKEND:
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 10000}
+
+RECIPES_CACHE_TIMEOUT = 60 * 15
+RECIPE_FRAGMENT_TIMEOUT = 60 * 60 * 24
+MEMBERSHIP_CACHE_TIMEOUT = 60 * 60
+AUTH_TOKEN_CACHE_TIMEOUT = 60
+AUTH_TOKEN_CACHE_SIZE = 10000
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -107,7 +132,16 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
 }
 
@@ -151,6 +185,36 @@ else:
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Recipe photos: uploads above these limits are rejected, resized
+# variants are generated by a background job.
+RECIPE_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_PIXELS = 40_000_000
+# Base64 inflates uploads by a third, leave room for the rest of the body.
+DATA_UPLOAD_MAX_MEMORY_SIZE = RECIPE_IMAGE_MAX_BYTES * 4 // 3 + 1024 * 1024
+
+# Background jobs are stored in the database and run by
+# `python manage.py run_jobs`. With JOBS_EAGER they run in the web
+# process right after the request's transaction commits instead.
+JOBS_EAGER = os.getenv('JOBS_EAGER', str(DEBUG)) == 'True'
+JOBS_WORKERS = int(os.getenv('JOBS_WORKERS', 2))
+JOBS_POLL_INTERVAL = 1
+JOBS_KEEP_FINISHED_DAYS = 7
+JOBS_SCHEDULE = {
+    'reconcile-counters': {
+        'cron': '30 3 * * *',
+        'job': 'recipes.reconcile_counters',
+    },
+    'rebuild-shopping-lists': {
+        'cron': '0 4 * * *',
+        'job': 'recipes.rebuild_shopping_lists',
+    },
+    'purge-finished-jobs': {
+        'cron': '0 5 * * *',
+        'job': 'jobs.purge_finished',
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,33 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id',
+        'name',
+        'status',
+        'attempts',
+        'run_at',
+        'finished',
+    )
+    list_filter = (
+        'status',
+        'name',
+    )
+    search_fields = ('name', 'dedupe_key')
+    readonly_fields = (
+        'locked_by',
+        'locked_until',
+        'last_error',
+        'created',
+        'finished',
+    )
+    actions = ('restart',)
+
+    @admin.action(description='Перезапустить выбранные задачи')
+    def restart(self, request, queryset):
+        restarted = sum(job.restart() for job in queryset)
+        self.message_user(request, f'Перезапущено задач: {restarted}')
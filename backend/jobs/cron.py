@@ -0,0 +1,61 @@
+FIELDS = (
+    ('minute', 0, 59),
+    ('hour', 0, 23),
+    ('day', 1, 31),
+    ('month', 1, 12),
+    ('weekday', 0, 7),
+)
+
+
+def parse_field(text, low, high):
+    values = set()
+    for part in text.split(','):
+        spec, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if spec == '*':
+            start, end = low, high
+        elif '-' in spec:
+            start, end = (int(value) for value in spec.split('-', 1))
+        else:
+            start = int(spec)
+            end = high if step > 1 else start
+        if step < 1 or start < low or end > high or start > end:
+            raise ValueError(f'Invalid cron field: {text}')
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronSchedule:
+    """Standard five-field cron expression: minute, hour, day of month,
+    month and day of week (0 or 7 is Sunday).
+
+    Fields accept `*`, numbers, ranges, lists and `/step`. As in cron,
+    when both day fields are restricted a day matching either runs."""
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != len(FIELDS):
+            raise ValueError(f'Invalid cron expression: {expression}')
+        self.expression = expression
+        self.fields = {
+            name: parse_field(part, low, high)
+            for part, (name, low, high) in zip(parts, FIELDS)
+        }
+        self.any_day = parts[2] == '*'
+        self.any_weekday = parts[4] == '*'
+
+    def __repr__(self):
+        return f'CronSchedule({self.expression!r})'
+
+    def matches(self, moment):
+        fields = self.fields
+        if (moment.minute not in fields['minute']
+                or moment.hour not in fields['hour']
+                or moment.month not in fields['month']):
+            return False
+        day = moment.day in fields['day']
+        weekday = (moment.isoweekday() in fields['weekday']
+                   or moment.isoweekday() - 7 in fields['weekday'])
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
@@ -0,0 +1,120 @@
+import os
+import signal
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from jobs.cron import CronSchedule
+from jobs.models import Job
+from jobs.registry import enqueue, retry_delay_of, timeout_of
+from jobs.worker import execute, init_process
+
+
+class Command(BaseCommand):
+    help = 'running queued background jobs and periodic jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int,
+                            default=settings.JOBS_WORKERS,
+                            help='number of worker processes')
+        parser.add_argument('--burst', action='store_true',
+                            help='exit once there are no due jobs')
+        parser.add_argument('--no-schedule', action='store_true',
+                            help='do not enqueue periodic jobs')
+
+    def handle(self, *args, **options):
+        self.worker = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        schedule = [] if options['no_schedule'] else [
+            (key, CronSchedule(entry['cron']), entry['job'],
+             entry.get('args', []))
+            for key, entry in settings.JOBS_SCHEDULE.items()
+        ]
+        processes = max(options['processes'], 1)
+        self.stdout.write(f'Обработчик {self.worker}, процессов: '
+                          f'{processes}')
+        pool = self.start_pool(processes)
+        running = {}
+        last_minute = None
+        try:
+            while not self.stopping:
+                minute = timezone.localtime().replace(second=0,
+                                                      microsecond=0)
+                if minute != last_minute:
+                    last_minute = minute
+                    self.enqueue_periodic(schedule, minute)
+                    Job.objects.fail_abandoned()
+                done = [future for future in running if future.done()]
+                for future in done:
+                    self.finish(running.pop(future), future)
+                claimed = []
+                if len(running) < processes:
+                    claimed = Job.objects.claim(
+                        self.worker, processes - len(running), timeout_of
+                    )
+                for job in claimed:
+                    try:
+                        future = pool.submit(execute, job.name, job.args)
+                    except BrokenProcessPool:
+                        pool.shutdown(wait=False)
+                        pool = self.start_pool(processes)
+                        future = pool.submit(execute, job.name, job.args)
+                    running[future] = job
+                if options['burst'] and not running and not claimed:
+                    break
+                if not claimed:
+                    if running:
+                        wait(running, timeout=settings.JOBS_POLL_INTERVAL,
+                             return_when=FIRST_COMPLETED)
+                    else:
+                        time.sleep(settings.JOBS_POLL_INTERVAL)
+            for future in wait(running).done:
+                self.finish(running.pop(future), future)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+        self.stdout.write(self.style.SUCCESS('Обработчик остановлен'))
+
+    def start_pool(self, processes):
+        # Pool processes open their own connections.
+        connections.close_all()
+        return ProcessPoolExecutor(
+            processes,
+            mp_context=get_context('spawn'),
+            initializer=init_process,
+        )
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def finish(self, job, future):
+        try:
+            error = future.result()
+        except Exception as exc:
+            # The pool process died or the result could not be pickled.
+            error = f'{type(exc).__name__}: {exc}'
+        if error is None:
+            job.mark_done()
+            status = 'выполнена'
+        else:
+            job.mark_failed(error, retry_delay_of(job.name))
+            status = 'ошибка'
+        self.stdout.write(f'{job} ({job.attempts}/{job.max_attempts}): '
+                          f'{status}')
+
+    def enqueue_periodic(self, schedule, minute):
+        for key, cron, name, args in schedule:
+            if not cron.matches(minute):
+                continue
+            dedupe_key = f'periodic:{key}:{minute:%Y%m%d%H%M}'
+            if Job.objects.filter(dedupe_key=dedupe_key).exists():
+                continue
+            enqueue(name, *args, dedupe_key=dedupe_key, eager=False)
@@ -0,0 +1,174 @@
+from datetime import timedelta
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+
+class JobQuerySet(models.QuerySet):
+
+    def claim(self, worker, limit, timeout_of):
+        """Lock up to `limit` due jobs for a worker.
+
+        Jobs whose worker has not reported back within its visibility
+        timeout are handed out again. Every claim is a conditional UPDATE,
+        so two workers can never run the same attempt."""
+        now = timezone.now()
+        due = self.filter(
+            Q(status=Job.QUEUED, run_at__lte=now)
+            | Q(status=Job.RUNNING, locked_until__lt=now)
+        ).filter(attempts__lt=F('max_attempts'))
+        claimed = []
+        with transaction.atomic():
+            candidates = list(
+                due.select_for_update(skip_locked=True).order_by(
+                    'run_at', 'id'
+                ).values_list('id', 'name', 'status', 'attempts')[:limit]
+            )
+            for job_id, name, status, attempts in candidates:
+                timeout_at = now + timedelta(seconds=timeout_of(name))
+                updated = self.filter(
+                    id=job_id, status=status, attempts=attempts
+                ).update(
+                    status=Job.RUNNING,
+                    attempts=attempts + 1,
+                    locked_by=worker,
+                    locked_until=timeout_at,
+                )
+                if updated:
+                    claimed.append(job_id)
+        return list(self.filter(id__in=claimed).order_by('run_at', 'id'))
+
+    def fail_abandoned(self):
+        """Give up on running jobs that timed out on their last attempt."""
+        return self.filter(
+            status=Job.RUNNING,
+            locked_until__lt=timezone.now(),
+            attempts__gte=F('max_attempts'),
+        ).update(
+            status=Job.FAILED,
+            finished=timezone.now(),
+            last_error='Превышено время выполнения',
+        )
+
+
+class Job(models.Model):
+    """Background job stored in the database"""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнено'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField('Задача', max_length=200)
+    args = models.JSONField('Аргументы', default=list, blank=True)
+    dedupe_key = models.CharField(
+        'Ключ дедупликации',
+        max_length=200,
+        null=True,
+        blank=True,
+    )
+    status = models.CharField(
+        'Статус',
+        max_length=10,
+        choices=STATUSES,
+        default=QUEUED,
+    )
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveSmallIntegerField(
+        'Максимум попыток',
+        default=3,
+    )
+    run_at = models.DateTimeField('Запустить не раньше', default=timezone.now)
+    locked_by = models.CharField('Исполнитель', max_length=200, blank=True)
+    locked_until = models.DateTimeField('Занята до', null=True, blank=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    created = models.DateTimeField('Создана', auto_now_add=True)
+    finished = models.DateTimeField('Завершена', null=True, blank=True)
+
+    objects = JobQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at')
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=Q(status='queued'),
+                name='unique_queued_job'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.id}'
+
+    def _owned(self):
+        return Job.objects.filter(
+            id=self.id,
+            status=Job.RUNNING,
+            locked_by=self.locked_by,
+            attempts=self.attempts,
+        )
+
+    def mark_done(self):
+        self._owned().update(
+            status=Job.DONE,
+            finished=timezone.now(),
+            locked_until=None,
+            last_error='',
+        )
+
+    def mark_failed(self, error, retry_delay):
+        """Queue the next attempt with exponential backoff, or fail the
+        job when its attempts are used up."""
+        if self.attempts >= self.max_attempts:
+            self._owned().update(
+                status=Job.FAILED,
+                finished=timezone.now(),
+                locked_until=None,
+                last_error=error,
+            )
+            return
+        delay = retry_delay * 2 ** (self.attempts - 1)
+        self._requeue(
+            self._owned(),
+            run_at=timezone.now() + timedelta(seconds=delay),
+            last_error=error,
+        )
+
+    def restart(self):
+        """Run the job again from its first attempt."""
+        return self._requeue(
+            Job.objects.filter(id=self.id).exclude(status=Job.RUNNING),
+            run_at=timezone.now(),
+            last_error='',
+            attempts=0,
+            finished=None,
+        )
+
+    @staticmethod
+    def _requeue(queryset, **changes):
+        """Put a job back in the queue. When another job is already
+        queued under the same dedupe key, that one takes its place."""
+        try:
+            with transaction.atomic():
+                return queryset.update(
+                    status=Job.QUEUED, locked_until=None, **changes
+                )
+        except IntegrityError:
+            return queryset.update(
+                status=Job.FAILED,
+                finished=timezone.now(),
+                locked_until=None,
+                last_error='Заменена задачей с тем же ключом',
+            )
@@ -0,0 +1,101 @@
+import logging
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+JobSpec = namedtuple(
+    'JobSpec', ('name', 'func', 'max_attempts', 'timeout', 'retry_delay')
+)
+
+_registry = {}
+
+DEFAULT_TIMEOUT = 300
+DEFAULT_RETRY_DELAY = 30
+# Time for the worker to report a job that hit its own timeout.
+LOCK_GRACE = 30
+
+
+def job(name=None, max_attempts=3, timeout=DEFAULT_TIMEOUT,
+        retry_delay=DEFAULT_RETRY_DELAY):
+    """Register a function as a background job.
+
+    The function gets an `enqueue` attribute with the same signature
+    plus `dedupe_key` and `delay` keyword arguments. Arguments must be
+    JSON-serializable."""
+
+    def decorator(func):
+        app_label = func.__module__.split('.')[0]
+        spec = JobSpec(name or f'{app_label}.{func.__name__}', func,
+                       max_attempts, timeout, retry_delay)
+        _registry[spec.name] = spec
+
+        def enqueue_job(*args, dedupe_key=None, delay=None):
+            return enqueue(spec.name, *args, dedupe_key=dedupe_key,
+                           delay=delay)
+
+        func.enqueue = enqueue_job
+        func.job_name = spec.name
+        return func
+
+    return decorator
+
+
+def get_job(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise LookupError(f'Unknown job: {name}')
+
+
+def timeout_of(name):
+    """Visibility timeout of a job: how long a claimed job stays locked
+    before it is handed to another worker."""
+    spec = _registry.get(name)
+    return (spec.timeout if spec else DEFAULT_TIMEOUT) + LOCK_GRACE
+
+
+def retry_delay_of(name):
+    spec = _registry.get(name)
+    return spec.retry_delay if spec else DEFAULT_RETRY_DELAY
+
+
+def run_inline(name, args):
+    try:
+        get_job(name).func(*args)
+    except Exception:
+        logger.exception('Job %s%r failed', name, tuple(args))
+
+
+def enqueue(name, *args, dedupe_key=None, delay=None, eager=None):
+    """Add a job to the queue as part of the current transaction.
+
+    While a job with the same dedupe key is waiting in the queue no other
+    one is added. With JOBS_EAGER the job runs in-process once the
+    transaction commits instead."""
+    spec = get_job(name)
+    if settings.JOBS_EAGER if eager is None else eager:
+        transaction.on_commit(lambda: run_inline(spec.name, args))
+        return None
+    run_at = timezone.now()
+    if delay:
+        run_at += timedelta(seconds=delay)
+    try:
+        with transaction.atomic():
+            return Job.objects.create(
+                name=spec.name,
+                args=list(args),
+                dedupe_key=dedupe_key,
+                max_attempts=spec.max_attempts,
+                run_at=run_at,
+            )
+    except IntegrityError:
+        if dedupe_key is None:
+            raise
+        return None
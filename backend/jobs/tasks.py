@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Job
+from .registry import job
+
+
+@job()
+def purge_finished():
+    """Delete completed jobs older than JOBS_KEEP_FINISHED_DAYS, failed
+    ones are kept for inspection."""
+    Job.objects.filter(
+        status=Job.DONE,
+        finished__lt=timezone.now() - timedelta(
+            days=settings.JOBS_KEEP_FINISHED_DAYS
+        ),
+    ).delete()
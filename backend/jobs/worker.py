@@ -0,0 +1,46 @@
+"""Entry points of the worker pool processes.
+
+The pool is started with the `spawn` method, so this module must be
+importable before Django is set up."""
+import signal
+import traceback
+
+
+class JobTimeout(Exception):
+    pass
+
+
+def _alarm(signum, frame):
+    raise JobTimeout('Превышено время выполнения')
+
+
+def init_process():
+    import django
+
+    django.setup()
+    # Shutdown is driven by the parent process.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if hasattr(signal, 'SIGALRM'):
+        signal.signal(signal.SIGALRM, _alarm)
+
+
+def execute(name, args):
+    """Run a job, returning None on success or the formatted traceback
+    of the error."""
+    from django.db import close_old_connections
+
+    from .registry import get_job
+
+    close_old_connections()
+    try:
+        spec = get_job(name)
+        if hasattr(signal, 'SIGALRM'):
+            signal.alarm(spec.timeout)
+        spec.func(*args)
+    except Exception:
+        return traceback.format_exc()
+    finally:
+        if hasattr(signal, 'SIGALRM'):
+            signal.alarm(0)
+        close_old_connections()
+    return None
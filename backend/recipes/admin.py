@@ -1,12 +1,15 @@
 from django.contrib import admin
 from django.contrib.admin import TabularInline
+
+from .images import schedule_image_processing
 from .models import (
     Ingredient,
     Tag,
     Recipe,
     ShoppingCart,
     Favorite,
-    IngredientInRecipe
+    IngredientInRecipe,
+    ShoppingListItem
 )
 
 
@@ -29,6 +32,7 @@ class RecipeAdmin(admin.ModelAdmin):
     list_display = (
         'name',
         'author',
+        'in_favorite',
     )
     list_filter = (
         'author',
@@ -37,9 +41,16 @@ class RecipeAdmin(admin.ModelAdmin):
     )
     inlines = (RecipeIngredientInline, )
 
-    @admin.display(empty_value=0)
+    def save_model(self, request, obj, form, change):
+        if 'image' in form.changed_data:
+            obj.image_variants = {}
+        super().save_model(request, obj, form, change)
+        if 'image' in form.changed_data:
+            schedule_image_processing(obj.id)
+
+    @admin.display(description='В избранном', ordering='favorites_count')
     def in_favorite(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
 
 
 @admin.register(Tag)
@@ -60,3 +71,8 @@ class FavoriteAdmin(admin.ModelAdmin):
 @admin.register(IngredientInRecipe)
 class IngredientInRecipeAdmin(admin.ModelAdmin):
     list_display = ('recipe', 'ingredient', 'amount')
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'amount')
@@ -0,0 +1,156 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps, ImageSequence
+
+from jobs.registry import enqueue
+from .models import Recipe
+
+Image.MAX_IMAGE_PIXELS = settings.RECIPE_IMAGE_MAX_PIXELS
+
+VARIANTS = {
+    'card': 480,
+    'detail': 960,
+    'retina': 1920,
+}
+FORMATS = {
+    'jpeg': ('JPEG', 'jpg', {'quality': 85, 'optimize': True,
+                             'progressive': True}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+}
+DEFAULT_FORMAT = 'jpeg'
+# Formats an uploaded original is kept in, anything else is stored as PNG.
+ORIGINAL_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+EXIF_ORIENTATION = 0x0112
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def check_dimensions(image):
+    """Reject images whose pixel count is above the limit before any
+    pixel data is decoded."""
+    width, height = image.size
+    if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+        raise ImageTooLarge(
+            f'Image is too large: {width}x{height} pixels, '
+            f'the limit is {settings.RECIPE_IMAGE_MAX_PIXELS}'
+        )
+
+
+def variant_path(variant, extension):
+    upload_to = Recipe._meta.get_field('image').upload_to
+    return os.path.join(upload_to, f'{variant}.{extension}')
+
+
+def image_name(name, variants, variant, image_format):
+    """Stored name of the requested variant, or of the original image
+    while the variants have not been generated yet."""
+    return (variants or {}).get(variant, {}).get(image_format) or name
+
+
+def image_url(field_file, variants, variant, image_format):
+    return field_file.storage.url(
+        image_name(field_file.name, variants, variant, image_format)
+    )
+
+
+def strip_metadata(source, name):
+    """Copy of an uploaded image without EXIF (camera, GPS position) and
+    other metadata, turned upright by its EXIF orientation.
+
+    A JPEG that needs no turning is re-encoded with its original
+    quantization tables and subsampling rather than a new quality
+    setting. Animated images keep all their frames, frame durations and
+    loop count, and are not turned."""
+    with Image.open(source) as image:
+        check_dimensions(image)
+        codec = image.format if image.format in ORIGINAL_FORMATS else 'PNG'
+        options = {}
+        if image.info.get('icc_profile'):
+            options['icc_profile'] = image.info['icc_profile']
+        if codec == 'GIF':
+            # Pillow writes the comment of the source back by default.
+            options['comment'] = b''
+        if getattr(image, 'is_animated', False):
+            durations = []
+            for frame in ImageSequence.Iterator(image):
+                # WebP frames only report their duration once loaded.
+                frame.load()
+                durations.append(frame.info.get('duration', 0))
+            options.update(save_all=True, duration=durations)
+            if 'loop' in image.info:
+                options['loop'] = image.info['loop']
+            image.seek(0)
+        elif image.getexif().get(EXIF_ORIENTATION, 1) != 1:
+            image = ImageOps.exif_transpose(image)
+            if codec == 'JPEG':
+                options['quality'] = 95
+        elif codec == 'JPEG':
+            options.update(quality='keep', subsampling='keep')
+        buffer = BytesIO()
+        image.save(buffer, codec, **options)
+    stem = os.path.splitext(os.path.basename(name))[0] or 'image'
+    return ContentFile(
+        buffer.getvalue(), name=f'{stem}.{ORIGINAL_FORMATS[codec]}'
+    )
+
+
+def render_variants(source):
+    """Resized, metadata-free copies of an image for every variant and
+    format, as {variant: {format: bytes}}."""
+    with Image.open(source) as image:
+        check_dimensions(image)
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            background = Image.new('RGB', image.size, 'white')
+            image = image.convert('RGBA')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        rendered = {}
+        for variant, width in VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail((width, width * 4), Image.LANCZOS)
+            rendered[variant] = {}
+            for image_format, (codec, _, options) in FORMATS.items():
+                buffer = BytesIO()
+                resized.save(buffer, codec, **options)
+                rendered[variant][image_format] = buffer.getvalue()
+        return rendered
+
+
+def process_recipe_image(recipe_id):
+    """Generate and store the variants of a recipe photo."""
+    recipe = Recipe.objects.filter(id=recipe_id).only('image').first()
+    if recipe is None or not recipe.image:
+        return
+    storage = recipe.image.storage
+    name = recipe.image.name
+    with storage.open(name, 'rb') as source:
+        rendered = render_variants(source)
+    variants = {}
+    for variant, formats in rendered.items():
+        variants[variant] = {}
+        for image_format, content in formats.items():
+            path = variant_path(variant, FORMATS[image_format][1])
+            variants[variant][image_format] = storage.save(
+                path, ContentFile(content)
+            )
+    with transaction.atomic():
+        recipe = Recipe.objects.select_for_update().filter(
+            id=recipe_id, image=name
+        ).first()
+        if recipe is not None:
+            recipe.image_variants = variants
+            recipe.save(update_fields=['image_variants'])
+
+
+def schedule_image_processing(recipe_id):
+    """Queue generation of the photo variants as part of the current
+    transaction."""
+    enqueue('recipes.process_image', recipe_id,
+            dedupe_key=f'recipe-image:{recipe_id}')
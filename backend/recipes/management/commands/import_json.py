@@ -1,36 +1,169 @@
+import csv
 import json
 import os
+import time
+from itertools import islice
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from django.db.utils import IntegrityError
 
-from recipes.models import Ingredient
+from api.cache import (INGREDIENTS_GENERATION, RECIPES_GENERATION,
+                       TAGS_GENERATION, increment_generation)
+from recipes.models import Ingredient, Tag
 
 DATA_ROOT = os.path.join(settings.BASE_DIR, 'static/data')
 
+MODELS = {
+    'ingredients': (Ingredient, ('name', 'measurement_unit'), ()),
+    'tags': (Tag, ('slug',), ('name', 'color')),
+}
+# Bulk writes send no post_save, so the caches built from these tables
+# are invalidated by the command itself.
+GENERATIONS = {
+    Ingredient: INGREDIENTS_GENERATION,
+    Tag: TAGS_GENERATION,
+}
+
+
+def iter_json_array(stream, chunk_size=64 * 1024):
+    """Yield the items of a top-level JSON array without loading the
+    whole document into memory."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    exhausted = False
+    started = False
+    while True:
+        buffer = buffer.lstrip()
+        if started and buffer.startswith(','):
+            buffer = buffer[1:].lstrip()
+        if started and buffer.startswith(']'):
+            return
+        if buffer and not started:
+            if not buffer.startswith('['):
+                raise CommandError('Ожидался JSON-массив')
+            buffer = buffer[1:]
+            started = True
+            continue
+        if buffer:
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                end = None
+            if end is not None and (end < len(buffer) or exhausted):
+                yield item
+                buffer = buffer[end:]
+                continue
+        if exhausted:
+            raise CommandError('Некорректный JSON')
+        chunk = stream.read(chunk_size)
+        exhausted = not chunk
+        buffer += chunk
+
+
+def iter_csv(stream, fields):
+    for line, row in enumerate(csv.reader(stream), start=1):
+        if not row:
+            continue
+        if len(row) != len(fields):
+            raise CommandError(f'Строка {line}: ожидалось полей '
+                               f'{len(fields)}, получено {len(row)}')
+        yield dict(zip(fields, row))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
 
 class Command(BaseCommand):
-    help = 'loading ingredients from data in json'
+    help = 'loading ingredients or tags from data in json or csv'
 
     def add_arguments(self, parser):
         parser.add_argument('filename', default='ingredients.json', nargs='?',
                             type=str)
+        parser.add_argument('--model', choices=MODELS,
+                            default='ingredients')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--update', action='store_true',
+                            help='update existing rows instead of '
+                                 'skipping them')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='report what would change without '
+                                 'writing anything')
 
     def handle(self, *args, **options):
+        model, key_fields, value_fields = MODELS[options['model']]
+        fields = key_fields + value_fields
+        path = os.path.join(DATA_ROOT, options['filename'])
+        started = time.monotonic()
+        counts = {'read': 0, 'created': 0, 'updated': 0, 'skipped': 0}
         try:
-            with open(os.path.join(DATA_ROOT, options['filename']), 'r',
-                      encoding='utf-8') as f:
-                data = json.load(f)
-                for ingredient in data:
-                    try:
-                        Ingredient.objects.create(name=ingredient["name"],
-                                                  measurement_unit=ingredient[
-                                                      "measurement_unit"])
-                    except IntegrityError:
-                        print(f'Ингридиет {ingredient["name"]} '
-                              f'{ingredient["measurement_unit"]} '
-                              f'уже есть в базе')
-
+            with open(path, 'r', encoding='utf-8') as f:
+                if path.endswith('.csv'):
+                    rows = iter_csv(f, fields)
+                else:
+                    rows = iter_json_array(f)
+                with transaction.atomic():
+                    for batch in batched(rows, options['batch_size']):
+                        self.load_batch(model, key_fields, value_fields,
+                                        batch, counts, options)
+                        self.stdout.write(
+                            f'Обработано строк: {counts["read"]}')
         except FileNotFoundError:
             raise CommandError('Файл отсутствует в директории data')
+        except (KeyError, TypeError) as error:
+            raise CommandError(f'Некорректная запись: нет поля {error}')
+        except IntegrityError as error:
+            raise CommandError(f'Конфликт данных: {error}')
+        if not options['dry_run'] and (counts['created']
+                                       or counts['updated']):
+            increment_generation(GENERATIONS[model])
+            increment_generation(RECIPES_GENERATION)
+
+        prefix = 'Будет ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}создано: {counts["created"]}, '
+            f'обновлено: {counts["updated"]}, '
+            f'пропущено: {counts["skipped"]} '
+            f'из {counts["read"]} за {time.monotonic() - started:.2f} с'
+        ))
+
+    def load_batch(self, model, key_fields, value_fields, batch, counts,
+                   options):
+        objects = {}
+        for row in batch:
+            values = {field: str(row[field]).strip()
+                      for field in key_fields + value_fields}
+            objects[tuple(values[field] for field in key_fields)] = (
+                model(**values))
+        counts['read'] += len(batch)
+        counts['skipped'] += len(batch) - len(objects)
+
+        existing = {
+            tuple(str(value) for value in key): pk
+            for *key, pk in model.objects.filter(
+                **{f'{key_fields[0]}__in': [key[0] for key in objects]}
+            ).values_list(*key_fields, 'pk')
+        }
+        new = [obj for key, obj in objects.items() if key not in existing]
+        changed = []
+        for key, obj in objects.items():
+            if key in existing:
+                if options['update'] and value_fields:
+                    obj.pk = existing[key]
+                    changed.append(obj)
+                else:
+                    counts['skipped'] += 1
+        counts['created'] += len(new)
+        counts['updated'] += len(changed)
+        if options['dry_run']:
+            return
+        model.objects.bulk_create(new, ignore_conflicts=True)
+        if changed:
+            model.objects.bulk_update(changed, value_fields)
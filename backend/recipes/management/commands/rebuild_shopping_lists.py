@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.transaction import atomic
+
+from recipes.models import (ShoppingCart, ShoppingListItem,
+                            expected_shopping_lists)
+
+
+def find_drift(expected, stored):
+    """Keys whose stored amount differs from the expected one."""
+    return {
+        key for key in set(expected) | set(stored)
+        if expected.get(key) != stored.get(key)
+    }
+
+
+class Command(BaseCommand):
+    help = ('repairing stored shopping list totals that drifted from '
+            'the shopping carts')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='only report drift, fail if there is any')
+
+    def handle(self, *args, **options):
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            )
+        }
+        drift = find_drift(expected_shopping_lists(), stored)
+        self.stdout.write(f'Расхождений: {len(drift)}')
+        if options['check']:
+            if drift:
+                raise CommandError('Списки покупок рассинхронизированы')
+            return
+        if not drift:
+            return
+        repaired = self.repair({user_id for user_id, _ in drift})
+        self.stdout.write(f'Исправлено записей: {repaired}')
+
+    @atomic
+    def repair(self, user_ids):
+        """Recompute the lists of the given users with their cart and
+        list rows locked, and rewrite only the rows that differ.
+
+        A cart change that commits meanwhile waits for the locks and
+        then applies its own delta on top of the repaired totals."""
+        list(ShoppingCart.objects.select_for_update().filter(
+            user_id__in=user_ids
+        ).values_list('id', flat=True))
+        rows = {
+            (user_id, ingredient_id): (pk, amount)
+            for pk, user_id, ingredient_id, amount
+            in ShoppingListItem.objects.select_for_update().filter(
+                user_id__in=user_ids
+            ).values_list('id', 'user_id', 'ingredient_id', 'amount')
+        }
+        expected = expected_shopping_lists(user_ids)
+        drift = find_drift(
+            expected, {key: amount for key, (_, amount) in rows.items()}
+        )
+        stale = [rows[key][0] for key in drift if key not in expected]
+        if stale:
+            ShoppingListItem.objects.filter(id__in=stale).delete()
+        ShoppingListItem.objects.bulk_update([
+            ShoppingListItem(id=rows[key][0], amount=expected[key])
+            for key in drift if key in expected and key in rows
+        ], ['amount'], batch_size=1000)
+        ShoppingListItem.objects.bulk_create([
+            ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                             amount=expected[user_id, ingredient_id])
+            for user_id, ingredient_id in drift
+            if (user_id, ingredient_id) not in rows
+        ], batch_size=1000, ignore_conflicts=True)
+        return len(drift)
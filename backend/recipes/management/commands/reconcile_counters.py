@@ -0,0 +1,54 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.transaction import atomic
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscribe
+
+User = get_user_model()
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscribe, 'author'),
+)
+
+
+def count_of(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'repairing stored favorite, cart, recipe and subscriber counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='only report drift, fail if there is any')
+
+    @atomic
+    def handle(self, *args, **options):
+        drifted_total = 0
+        for model, counter, related, field in COUNTERS:
+            actual = count_of(related, field)
+            drifted = list(
+                model.objects.annotate(actual=actual).exclude(
+                    **{counter: F('actual')}
+                ).values_list('pk', flat=True)
+            )
+            drifted_total += len(drifted)
+            self.stdout.write(
+                f'{model._meta.model_name}.{counter}: {len(drifted)}'
+            )
+            if drifted and not options['check']:
+                model.objects.filter(pk__in=drifted).update(
+                    **{counter: actual}
+                )
+        if options['check'] and drifted_total:
+            raise CommandError('Счётчики рассинхронизированы')
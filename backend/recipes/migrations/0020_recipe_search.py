@@ -0,0 +1,87 @@
+from django.db import migrations
+
+POSTGRES_FORWARD = (
+    """
+    ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian', coalesce(name, '')), 'A')
+        || setweight(to_tsvector('russian', coalesce(text, '')), 'B')
+    ) STORED
+    """,
+    """
+    CREATE INDEX recipe_search_vector ON recipes_recipe
+    USING GIN (search_vector)
+    """,
+)
+POSTGRES_BACKWARD = (
+    'ALTER TABLE recipes_recipe DROP COLUMN search_vector',
+)
+
+# FTS5 has no Russian stemmer and does not fold "ё", so the indexed
+# copy is folded here and queries are folded in recipes.search.
+# SQLite drops triggers when a migration rebuilds recipes_recipe, such a
+# migration has to create them again.
+SQLITE_FOLD = "replace(replace({0}, 'ё', 'е'), 'Ё', 'Е')"
+SQLITE_INSERT = (
+    'INSERT INTO recipes_recipe_fts (rowid, name, text) '
+    'SELECT {0}id, %s, %s' % (SQLITE_FOLD.format('{0}name'),
+                              SQLITE_FOLD.format('{0}text'))
+)
+SQLITE_FORWARD = (
+    """
+    CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5(
+        name, text, tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    SQLITE_INSERT.format('') + ' FROM recipes_recipe',
+    """
+    CREATE TRIGGER recipes_recipe_fts_insert
+    AFTER INSERT ON recipes_recipe BEGIN
+        %s;
+    END
+    """ % SQLITE_INSERT.format('new.'),
+    """
+    CREATE TRIGGER recipes_recipe_fts_update
+    AFTER UPDATE OF name, text ON recipes_recipe BEGIN
+        DELETE FROM recipes_recipe_fts WHERE rowid = old.id;
+        %s;
+    END
+    """ % SQLITE_INSERT.format('new.'),
+    """
+    CREATE TRIGGER recipes_recipe_fts_delete
+    AFTER DELETE ON recipes_recipe BEGIN
+        DELETE FROM recipes_recipe_fts WHERE rowid = old.id;
+    END
+    """,
+)
+SQLITE_BACKWARD = (
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_insert',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_update',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_delete',
+    'DROP TABLE IF EXISTS recipes_recipe_fts',
+)
+
+
+def run_for_vendor(statements):
+
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(statement, params=None)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0019_recipe_image_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({'postgresql': POSTGRES_FORWARD,
+                            'sqlite': SQLITE_FORWARD}),
+            run_for_vendor({'postgresql': POSTGRES_BACKWARD,
+                            'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,73 @@
+from django.db import migrations
+from django.db.models import Count, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def remove_duplicates(model):
+    """Delete all but the first row of every (user, recipe) pair and
+    return the pairs that had duplicates."""
+    duplicates = list(model.objects.order_by().values(
+        'user', 'recipe'
+    ).annotate(
+        keep=Min('id'), total=Count('id')
+    ).filter(total__gt=1))
+    for group in duplicates:
+        model.objects.filter(
+            user=group['user'], recipe=group['recipe']
+        ).exclude(id=group['keep']).delete()
+    return duplicates
+
+
+def remove_duplicate_favorites_and_carts(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+
+    favorites = remove_duplicates(Favorite)
+    Recipe.objects.filter(
+        id__in={group['recipe'] for group in favorites}
+    ).update(favorites_count=count_of(Favorite, 'recipe'))
+
+    carts = remove_duplicates(ShoppingCart)
+    Recipe.objects.filter(
+        id__in={group['recipe'] for group in carts}
+    ).update(in_carts_count=count_of(ShoppingCart, 'recipe'))
+    users = {group['user'] for group in carts}
+    if not users:
+        return
+    # Duplicate cart rows were counted twice in the stored totals.
+    ShoppingListItem.objects.filter(user__in=users).delete()
+    totals = IngredientInRecipe.objects.filter(
+        recipe__shopping_cart__user__in=users
+    ).order_by().values(
+        'recipe__shopping_cart__user', 'ingredient'
+    ).annotate(total=Sum('amount'))
+    ShoppingListItem.objects.bulk_create([
+        ShoppingListItem(
+            user_id=row['recipe__shopping_cart__user'],
+            ingredient_id=row['ingredient'],
+            amount=row['total'],
+        ) for row in totals
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0020_recipe_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_favorites_and_carts,
+                             migrations.RunPython.noop),
+    ]
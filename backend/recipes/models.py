@@ -1,8 +1,13 @@
-from django.db import models
+from django.db import connections, models
+from django.db.models import Case, F, Sum, Value, When
+from django.db.models.functions import Greatest
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 
+from users.models import StoredCountersMixin
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
 MIN_COOKING_TIME = 1
@@ -11,6 +16,11 @@ MIN_INGREDIENT_AMOUNT = 1
 MAX_INGREDIENT_AMOUNT = 32000
 
 
+def update_counter(queryset, field, delta):
+    """Atomically shift a stored counter, never going below zero."""
+    queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
 class Ingredient(models.Model):
     """Ingredient model"""
 
@@ -20,6 +30,12 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -37,8 +53,7 @@ class Tag(models.Model):
                              db_index=False)
     slug = models.SlugField('Уникальный слаг',
                             unique=True,
-                            max_length=200,
-                            db_index=False)
+                            max_length=200)
 
     class Meta:
         verbose_name = 'Тег'
@@ -48,9 +63,11 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(StoredCountersMixin, models.Model):
     """Recipe model"""
 
+    counter_fields = ('favorites_count', 'in_carts_count')
+
     name = models.CharField('Название рецепта', max_length=200)
     text = models.TextField('Опиисание')
     author = models.ForeignKey(
@@ -63,6 +80,13 @@ class Recipe(models.Model):
     image = models.ImageField(
         'Фотография блюда',
         upload_to='recipes/',
+        storage=ContentAddressedStorage(),
+    )
+    image_variants = models.JSONField(
+        'Размеры фотографии',
+        default=dict,
+        blank=True,
+        editable=False,
     )
     tags = models.ManyToManyField(
         Tag,
@@ -91,18 +115,29 @@ class Recipe(models.Model):
         editable=False,
         default=timezone.now,
     )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'В списках покупок',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id')
+        ]
 
     def __str__(self):
         return self.name
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-
 
 class IngredientInRecipe(models.Model):
     """Ingredient in recipe model"""
@@ -139,6 +174,38 @@ class IngredientInRecipe(models.Model):
         return self.ingredient.name
 
 
+class UserRecipeQuerySet(models.QuerySet):
+    """Adding and removing (user, recipe) rows in one statement each."""
+
+    def add(self, user_id, recipe_id):
+        """Insert the row unless it already exists or the recipe does
+        not, return whether it was inserted."""
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(self.model._meta.db_table)} '
+                f'(user_id, recipe_id) '
+                f'SELECT %s, id FROM {quote(Recipe._meta.db_table)} '
+                f'WHERE id = %s '
+                f'ON CONFLICT (user_id, recipe_id) DO NOTHING',
+                [user_id, recipe_id]
+            )
+            return cursor.rowcount == 1
+
+    def remove(self, user_id, recipe_id):
+        """Delete the row, return whether it existed."""
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {quote(self.model._meta.db_table)} '
+                f'WHERE user_id = %s AND recipe_id = %s',
+                [user_id, recipe_id]
+            )
+            return cursor.rowcount == 1
+
+
 class Favorite(models.Model):
     """Model for adding recipe to favorites"""
 
@@ -156,11 +223,13 @@ class Favorite(models.Model):
         on_delete=models.CASCADE
     )
 
+    objects = UserRecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Избраннный рецепт'
         verbose_name_plural = 'Избранные рецепты'
         ordering = ['id']
-        models.constraints = [
+        constraints = [
             models.UniqueConstraint(
                 fields=['user', 'recipe'],
                 name='user_favorite_recipe'
@@ -187,11 +256,13 @@ class ShoppingCart(models.Model):
         on_delete=models.CASCADE
     )
 
+    objects = UserRecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Рецепт в листе покупок'
         verbose_name_plural = 'Рецепты в листе покупок'
         ordering = ['id']
-        models.constraints = [
+        constraints = [
             models.UniqueConstraint(
                 fields=['user', 'recipe'],
                 name='user_shopping_recipe'
@@ -200,3 +271,119 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f"{self.recipe} is in {self.user}s shopping cart"
+
+
+class ShoppingListQuerySet(models.QuerySet):
+
+    def apply(self, user_ids, deltas):
+        """Add signed ingredient amounts to the lists of the given users.
+
+        Runs a fixed number of statements however many users and
+        ingredients are involved. Rows whose total drops to zero are
+        removed."""
+        user_ids = list(user_ids)
+        deltas = {pk: amount for pk, amount in deltas.items() if amount}
+        if not user_ids or not deltas:
+            return
+        rows = self.filter(user_id__in=user_ids, ingredient_id__in=deltas)
+        existing = set(rows.values_list('user_id', 'ingredient_id'))
+        if existing:
+            rows.update(amount=F('amount') + Case(
+                *(When(ingredient_id=pk, then=Value(amount))
+                  for pk, amount in deltas.items()),
+                output_field=models.IntegerField(),
+            ))
+        self.bulk_create([
+            self.model(user_id=user_id, ingredient_id=pk, amount=amount)
+            for user_id in user_ids
+            for pk, amount in deltas.items()
+            if amount > 0 and (user_id, pk) not in existing
+        ])
+        if existing:
+            rows.filter(amount__lte=0).delete()
+
+    def add_recipe(self, user, recipe_id):
+        self.apply([user.id], recipe_amounts(recipe_id))
+
+    def remove_recipe(self, user, recipe_id):
+        self.apply([user.id], {
+            pk: -amount for pk, amount in recipe_amounts(recipe_id).items()
+        })
+
+    def change_recipe(self, recipe_id, old_amounts, new_amounts):
+        """Apply an edit of a recipe's ingredients to every shopping
+        list that contains the recipe."""
+        deltas = {
+            pk: new_amounts.get(pk, 0) - old_amounts.get(pk, 0)
+            for pk in set(old_amounts) | set(new_amounts)
+        }
+        if not any(deltas.values()):
+            return
+        self.apply(
+            ShoppingCart.objects.filter(
+                recipe_id=recipe_id
+            ).values_list('user_id', flat=True),
+            deltas
+        )
+
+
+def recipe_amounts(recipe_id):
+    """Ingredient amounts of a recipe as {ingredient_id: amount}."""
+    return dict(
+        IngredientInRecipe.objects.filter(
+            recipe_id=recipe_id
+        ).order_by().values('ingredient_id').annotate(
+            total=Sum('amount')
+        ).values_list('ingredient_id', 'total')
+    )
+
+
+def expected_shopping_lists(user_ids=None):
+    """Shopping list totals computed from scratch from the carts, as
+    {(user_id, ingredient_id): amount}, of all users or of the given
+    ones."""
+    if user_ids is None:
+        carts = {'recipe__shopping_cart__isnull': False}
+    else:
+        carts = {'recipe__shopping_cart__user__in': user_ids}
+    totals = IngredientInRecipe.objects.filter(**carts).order_by().values(
+        'recipe__shopping_cart__user', 'ingredient'
+    ).annotate(total=Sum('amount'))
+    return {
+        (row['recipe__shopping_cart__user'], row['ingredient']): row['total']
+        for row in totals
+    }
+
+
+class ShoppingListItem(models.Model):
+    """Total amount of an ingredient over a user's shopping cart"""
+
+    user = models.ForeignKey(
+        User,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+        on_delete=models.CASCADE
+    )
+    amount = models.IntegerField('Количество', default=0)
+
+    objects = ShoppingListQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в листе покупок'
+        verbose_name_plural = 'Ингредиенты в листе покупок'
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='user_shopping_list_ingredient'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} {self.amount} for {self.user}'
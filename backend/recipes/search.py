@@ -0,0 +1,73 @@
+"""Full-text search over recipe names and descriptions.
+
+PostgreSQL uses the generated `search_vector` column (Russian stemming,
+GIN index), SQLite the `recipes_recipe_fts` FTS5 table kept in sync by
+triggers. Both are created by migration 0020_recipe_search and are not
+part of the model. Other databases fall back to a case-insensitive
+substring match."""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+# Matches in the name weigh more than matches in the description.
+NAME_WEIGHT = 10.0
+TEXT_WEIGHT = 1.0
+
+POSTGRES_MATCH = (
+    '"recipes_recipe"."search_vector" '
+    '@@ websearch_to_tsquery(%s::regconfig, %s)'
+)
+POSTGRES_RANK = (
+    'ts_rank("recipes_recipe"."search_vector", '
+    'websearch_to_tsquery(%s::regconfig, %s))'
+)
+SQLITE_MATCH = (
+    '"recipes_recipe"."id" IN (SELECT rowid FROM recipes_recipe_fts '
+    'WHERE recipes_recipe_fts MATCH %s)'
+)
+SQLITE_RANK = (
+    '(SELECT -bm25(recipes_recipe_fts, %s, %s) FROM recipes_recipe_fts '
+    'WHERE recipes_recipe_fts MATCH %s '
+    'AND rowid = "recipes_recipe"."id")'
+)
+
+WORD_RE = re.compile(r'\w+')
+
+
+def fold(text):
+    return text.lower().replace('ё', 'е')
+
+
+def fts5_query(text):
+    """FTS5 query matching every word of the text as a prefix. Words are
+    quoted, so FTS5 operators in user input have no effect."""
+    return ' '.join(f'"{word}"*' for word in WORD_RE.findall(fold(text)))
+
+
+def search_recipes(queryset, text):
+    """Recipes matching the text, annotated with `search_rank` and
+    ordered by it, most relevant first."""
+    text = text.strip()
+    if not text:
+        return queryset
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        params = (SEARCH_CONFIG, text)
+        match = RawSQL(POSTGRES_MATCH, params, output_field=BooleanField())
+        rank = RawSQL(POSTGRES_RANK, params, output_field=FloatField())
+    elif vendor == 'sqlite':
+        query = fts5_query(text)
+        if not query:
+            return queryset.none()
+        match = RawSQL(SQLITE_MATCH, (query,), output_field=BooleanField())
+        rank = RawSQL(SQLITE_RANK, (NAME_WEIGHT, TEXT_WEIGHT, query),
+                      output_field=FloatField())
+    else:
+        match = Q(name__icontains=text) | Q(text__icontains=text)
+        rank = Value(0.0, output_field=FloatField())
+    return queryset.filter(match).annotate(search_rank=rank).order_by(
+        '-search_rank', '-pub_date', '-id'
+    )
@@ -0,0 +1,21 @@
+from io import StringIO
+
+from django.core.management import call_command
+
+from jobs.registry import job
+from .images import process_recipe_image
+
+
+@job(timeout=120)
+def process_image(recipe_id):
+    process_recipe_image(recipe_id)
+
+
+@job(max_attempts=1, timeout=3600)
+def reconcile_counters():
+    call_command('reconcile_counters', stdout=StringIO())
+
+
+@job(max_attempts=1, timeout=3600)
+def rebuild_shopping_lists():
+    call_command('rebuild_shopping_lists', stdout=StringIO())
@@ -0,0 +1,127 @@
+from io import BytesIO, StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase
+from PIL import Image
+
+from .images import strip_metadata
+from .models import (Ingredient, IngredientInRecipe, Recipe, ShoppingCart,
+                     ShoppingListItem)
+
+User = get_user_model()
+
+
+class RebuildShoppingListsTests(TestCase):
+    """rebuild_shopping_lists reports drift of the stored lists and
+    rewrites only the rows that drifted."""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                email=f'user{i}@example.com', username=f'user{i}',
+                first_name='Имя', last_name=str(i), password='Pass-1234',
+            )
+            for i in range(2)
+        ]
+        self.ingredients = [
+            Ingredient.objects.create(name=f'Продукт {i}',
+                                      measurement_unit='г')
+            for i in range(4)
+        ]
+        recipe = Recipe.objects.create(
+            author=self.users[0], name='Каша', text='Описание',
+            cooking_time=10,
+        )
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient,
+                               amount=10 * i)
+            for i, ingredient in enumerate(self.ingredients[:3], start=1)
+        ])
+        for user in self.users:
+            ShoppingCart.objects.create(user=user, recipe=recipe)
+
+    def stored(self):
+        return {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            )
+        }
+
+    def rebuild(self, *args):
+        call_command('rebuild_shopping_lists', *args, stdout=self.output)
+
+    def test_repair(self):
+        first, second = self.users
+        correct = ShoppingListItem.objects.create(
+            user=first, ingredient=self.ingredients[0], amount=10
+        )
+        ShoppingListItem.objects.bulk_create([
+            # A wrong amount.
+            ShoppingListItem(user=first, ingredient=self.ingredients[1],
+                             amount=5),
+            # A row of an ingredient that is in no cart of the user.
+            ShoppingListItem(user=first, ingredient=self.ingredients[3],
+                             amount=7),
+        ] + [
+            ShoppingListItem(user=second, ingredient=ingredient,
+                             amount=10 * i)
+            for i, ingredient in enumerate(self.ingredients[:3], start=1)
+        ])
+        # The third ingredient of the first user is missing.
+        expected = {
+            (user.id, ingredient.id): 10 * i
+            for user in self.users
+            for i, ingredient in enumerate(self.ingredients[:3], start=1)
+        }
+        untouched = list(
+            ShoppingListItem.objects.filter(user=second).values_list(
+                'id', flat=True
+            )
+        )
+        with self.assertRaises(CommandError):
+            self.output = StringIO()
+            self.rebuild('--check')
+        self.assertIn('Расхождений: 3', self.output.getvalue())
+
+        self.output = StringIO()
+        self.rebuild()
+        self.assertIn('Исправлено записей: 3', self.output.getvalue())
+        self.assertEqual(self.stored(), expected)
+        self.assertTrue(ShoppingListItem.objects.filter(
+            id=correct.id, amount=10
+        ).exists())
+        self.assertEqual(
+            list(ShoppingListItem.objects.filter(user=second).values_list(
+                'id', flat=True
+            )),
+            untouched
+        )
+
+        self.output = StringIO()
+        self.rebuild('--check')
+        self.assertIn('Расхождений: 0', self.output.getvalue())
+
+
+class StripMetadataTests(SimpleTestCase):
+
+    def test_animated_gif(self):
+        source = BytesIO()
+        frames = [Image.new('RGB', (20, 20), color)
+                  for color in ('red', 'green', 'blue')]
+        frames[0].save(source, 'GIF', save_all=True,
+                       append_images=frames[1:], duration=[100, 200, 300],
+                       loop=2, comment=b'secret')
+        source.seek(0)
+        stripped = strip_metadata(source, 'cat.gif')
+        self.assertEqual(stripped.name, 'cat.gif')
+        with Image.open(stripped) as image:
+            self.assertNotIn('comment', image.info)
+            self.assertEqual(image.info['loop'], 2)
+            durations = []
+            for frame in range(image.n_frames):
+                image.seek(frame)
+                durations.append(image.info['duration'])
+        self.assertEqual(durations, [100, 200, 300])
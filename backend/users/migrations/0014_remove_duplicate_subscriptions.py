@@ -0,0 +1,40 @@
+from django.db import migrations
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def remove_duplicate_subscriptions(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Subscribe = apps.get_model('users', 'Subscribe')
+    duplicates = list(Subscribe.objects.order_by().values(
+        'user', 'author'
+    ).annotate(
+        keep=Min('id'), total=Count('id')
+    ).filter(total__gt=1))
+    for group in duplicates:
+        Subscribe.objects.filter(
+            user=group['user'], author=group['author']
+        ).exclude(id=group['keep']).delete()
+    User.objects.filter(
+        id__in={group['author'] for group in duplicates}
+    ).update(subscribers_count=count_of(Subscribe, 'author'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_user_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_subscriptions,
+                             migrations.RunPython.noop),
+    ]
@@ -2,16 +2,45 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 
 
-class User(AbstractUser):
+class StoredCountersMixin:
+    """Keep save() from writing back counters that are maintained
+    with F() updates, so a stale instance cannot overwrite them."""
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(StoredCountersMixin, AbstractUser):
     """User model"""
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
+    counter_fields = ('recipes_count', 'subscribers_count')
     email = models.EmailField(
         'email',
         max_length=254,
         unique=True
     )
+    recipes_count = models.PositiveIntegerField(
+        'Рецептов',
+        default=0,
+        editable=False,
+    )
+    subscribers_count = models.PositiveIntegerField(
+        'Подписчиков',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -39,7 +68,7 @@ class Subscribe(models.Model):
 
     class Meta:
         ordering = ('-id',)
-        models.constraints = [
+        constraints = [
             models.UniqueConstraint(
                 fields=['user', 'author'],
                 name='user_following_author'